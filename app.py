@@ -1,19 +1,35 @@
-from fastapi import FastAPI, Request, HTTPException, Depends, status, Body, BackgroundTasks
+import time
+_import_started = time.perf_counter()
+
+from fastapi import APIRouter, FastAPI, Request, HTTPException, Depends, Header, status, BackgroundTasks
+from fastapi.responses import Response, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from contextlib import asynccontextmanager
 import asyncio
 import os
 import uuid
 import logging
+import importlib
+import functools
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
 from pydantic import BaseModel
-import bcrypt
 
-from generator import create_qr_code_with_key
+# Тяжёлые модули (qrcode, Pillow, pyzbar, jose) здесь не импортируются:
+# они загружаются в фоне после старта или при первом обращении
+from generator import create_qr_code_with_key, create_qr_code_in_memory, MEDIA_TYPES, QR_FOLDER
+from token_cache import TokenCache
 from bd import Database
-from chek_photo import process_image_from_endpoint, start_delete_task
+from key_store import KeyStore, KEY_LIFE_TIME
+from passwords import PasswordHasher, PasswordPoolBusy
+from decode_pool import DecodePool, CameraBusy, DecodePoolSaturated
+from door_lock import DoorRegistry
+from qr_pool import QRKeyPool
+from chek_photo import process_image_from_endpoint, process_qr_text, save_frame, SAVE_SHOT_IMAGES, IMAGE_FOLDER, DELETE_INTERVAL
+from shared_state import create_shared_state, WEB_CONCURRENCY
+from maintenance import Maintenance
+from metrics import Gauge, HTTP_REQUEST_SECONDS, render_metrics, start_profile, stop_profile
 
 # --- Настройка логирования ---
 logging.basicConfig(level=logging.INFO)
@@ -23,25 +39,129 @@ logger = logging.getLogger(__name__)
 SECRET_KEY = "your_secret_key_here_change_it"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "10000"))
+# В stateless-режиме существование пользователя не проверяется в базе,
+# достаточно подписи и claim "sub"; отзыв токенов — через /auth/logout
+AUTH_STATELESS = os.environ.get("AUTH_STATELESS", "0").lower() in ("1", "true", "yes")
 
-# --- Инициализация FastAPI ---
-app = FastAPI()
-
-# --- CORS ---
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# --- Конфигурация QR-кодов ---
+# memory — QR-код рендерится в память и отдаётся через /qr/{qr_id}
+# file — старый режим с записью PNG в QRfolder
+QR_RENDER_MODE = os.environ.get("QR_RENDER_MODE", "memory")
+QR_LIFE_TIME = KEY_LIFE_TIME
+
+# --- Конфигурация приёма кадров ---
+MAX_FRAME_BYTES = int(os.environ.get("MAX_FRAME_BYTES", str(10 * 1024 * 1024)))
+
+# --- Конфигурация запуска ---
+# 1 — после старта в фоне загрузить стек распознавания и наполнить пул QR-кодов,
+# 0 — всё загружается при первом запросе
+WARM_UP = os.environ.get("WARM_UP", "1").lower() in ("1", "true", "yes")
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
+# --- Ресурсы процесса ---
+class Resources:
+    """Всё, что сервер открывает при старте и закрывает при остановке.
+
+    Ресурсы принадлежат приложению: обработчики получают их через
+    get_resources, а не через глобальные объекты модулей.
+    """
+
+    def __init__(self):
+        self.token_cache = TokenCache(maxsize=TOKEN_CACHE_SIZE, default_ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+        self.startup_seconds = 0.0
+        self.warm_up_seconds = 0.0
+        self._tasks = []
+
+    async def start(self):
+        started = time.perf_counter()
+        self.db = await asyncio.to_thread(Database)
+        self.key_store = KeyStore(self.db)
+        self.password_hasher = PasswordHasher()
+        self.decode_pool = DecodePool()
+        self.door_registry = DoorRegistry.from_config()
+        # Пул готовых PNG нужен только /show в режиме memory
+        self.qr_pool = QRKeyPool() if QR_RENDER_MODE != "file" else None
+
+        # Общее состояние воркеров и фоновые задачи
+        self.shared_state = create_shared_state(self.db)
+        folders_to_sweep = [(QR_FOLDER, QR_LIFE_TIME)]
+        if SAVE_SHOT_IMAGES:
+            folders_to_sweep.append((IMAGE_FOLDER, DELETE_INTERVAL))
+        self.maintenance = Maintenance(self.shared_state, self.key_store, self.token_cache, folders_to_sweep)
+        self._tasks.append(asyncio.create_task(self.maintenance.sweep_forever()))
+        self._tasks.append(asyncio.create_task(self.maintenance.sync_revocations_forever()))
+        if WARM_UP:
+            self._tasks.append(asyncio.create_task(self.warm_up()))
 
-# --- Статические файлы ---
-os.makedirs("QRfolder", exist_ok=True)
-app.mount("/QRfolder", StaticFiles(directory="QRfolder"), name="QRfolder")
+        self._register_metrics()
+        self.startup_seconds = time.perf_counter() - started
+        logger.info(f"Импорт приложения {IMPORT_SECONDS * 1000:.0f} мс, запуск {self.startup_seconds * 1000:.0f} мс")
 
-# --- Инициализация базы данных ---
-db = Database("users.db")
+    async def warm_up(self):
+        """Загружает тяжёлые модули, пока сервер уже принимает запросы"""
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(importlib.import_module, "jose")
+            if self.qr_pool is not None:
+                self.qr_pool.start()
+            await self.decode_pool.warm_up()
+        except Exception as e:
+            logger.error(f"Ошибка при прогреве: {e}")
+        self.warm_up_seconds = time.perf_counter() - started
+        logger.info(f"Прогрев завершён за {self.warm_up_seconds * 1000:.0f} мс")
+
+    def _register_metrics(self):
+        Gauge("app_import_seconds", "Время импорта app.py", lambda: IMPORT_SECONDS)
+        Gauge("app_startup_seconds", "Время запуска ресурсов в lifespan", lambda: self.startup_seconds)
+        Gauge("app_warm_up_seconds", "Время фоновой загрузки тяжёлых модулей", lambda: self.warm_up_seconds)
+        Gauge("decode_queue_depth", "Кадры в пуле распознавания", lambda: self.decode_pool.stats()["queue_depth"])
+        if self.qr_pool is not None:
+            Gauge("qr_pool_size", "Готовые QR-коды в пуле", lambda: self.qr_pool.stats()["size"])
+            Gauge("qr_pool_empty_total", "Запросы /show при пустом пуле QR-кодов", lambda: self.qr_pool.empty_events, kind="counter")
+        Gauge("token_cache_hits_total", "Попадания в кэш токенов", lambda: self.token_cache.hits, kind="counter")
+        Gauge("token_cache_misses_total", "Промахи кэша токенов", lambda: self.token_cache.misses, kind="counter")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        if self.qr_pool is not None:
+            await self.qr_pool.stop()
+        self.decode_pool.close()
+        await self.door_registry.close()
+        await asyncio.to_thread(self.password_hasher.close)
+        await asyncio.to_thread(self.db.close)
+
+def get_resources(request: Request) -> Resources:
+    return request.app.state.resources
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    resources = Resources()
+    await resources.start()
+    app.state.resources = resources
+    try:
+        yield
+    finally:
+        await resources.stop()
+
+async def timing_middleware(request: Request, call_next):
+    profile = start_profile()
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, path=path, status=status_code)
+        if profile is not None:
+            stop_profile(profile, f"{request.method}{path}")
+
+router = APIRouter()
 
 # --- OAuth2 схема ---
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -58,41 +178,49 @@ class UserInDB(BaseModel):
     login: str
     hashed_password: str
 
+class CurrentUser(BaseModel):
+    login: str
+
 class UserRegisterRequest(BaseModel):
     login: str
     password: str
 
 # --- Вспомогательные функции ---
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
-
-def get_user(username: str):
-    db.cursor.execute("SELECT login, password FROM users WHERE login = ?", (username,))
-    row = db.cursor.fetchone()
+def get_user(db, username: str):
+    row = db.get_user(username)
     if row:
         return UserInDB(login=row[0], hashed_password=row[1])
     return None
 
-def authenticate_user(username: str, password: str):
-    user = get_user(username)
+async def authenticate_user(res: Resources, username: str, password: str):
+    user = await res.db.run(get_user, res.db, username)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await res.password_hasher.verify(password, user.hashed_password):
         return None
     return user
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
+    from jose import jwt
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme), res: Resources = Depends(get_resources)):
+    from jose import JWTError, jwt
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Неверный токен авторизации",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    token_cache = res.token_cache
+    token_hash = token_cache.token_hash(token)
+    if token_cache.is_revoked(token_hash):
+        raise credentials_exception
+    cached_user = token_cache.get(token_hash)
+    if cached_user is not None:
+        return cached_user
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         login: str = payload.get("sub")
@@ -101,16 +229,22 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         token_data = TokenData(login=login)
     except JWTError:
         raise credentials_exception
-    user = get_user(username=token_data.login)  # <-- исправлено здесь
-    if user is None:
-        raise credentials_exception
-    return user
+    if not AUTH_STATELESS:
+        user = await res.db.run(get_user, res.db, token_data.login)
+        if user is None:
+            raise credentials_exception
+    current_user = CurrentUser(login=token_data.login)
+    token_cache.put(token_hash, current_user, payload.get("exp"))
+    return current_user
 
 
 # --- Эндпоинт для получения токена ---
-@app.post("/token")
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+@router.post("/token")
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), res: Resources = Depends(get_resources)):
+    try:
+        user = await authenticate_user(res, form_data.username, form_data.password)
+    except PasswordPoolBusy:
+        raise HTTPException(status_code=503, detail="Сервер перегружен, повторите попытку позже")
     if not user:
         raise HTTPException(status_code=400, detail="Неверный логин или пароль")
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -119,71 +253,182 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
+# --- Отзыв токена ---
+@router.post("/auth/logout")
+async def logout(
+    token: str = Depends(oauth2_scheme),
+    current_user: CurrentUser = Depends(get_current_user),
+    res: Resources = Depends(get_resources)):
+    token_hash = res.token_cache.token_hash(token)
+    expires_at = res.token_cache.get_expiry(token_hash)
+    res.token_cache.revoke(token_hash, expires_at)
+    await res.shared_state.revoke_token(token_hash, expires_at)
+    return {"status": "success", "message": "Токен отозван"}
+
+# --- Метрики Prometheus ---
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# --- Статистика ---
+@router.get("/stats")
+async def get_stats(res: Resources = Depends(get_resources)):
+    return {
+        "token_cache": res.token_cache.stats(),
+        "decode_pool": res.decode_pool.stats(),
+        "doors": res.door_registry.stats(),
+        "qr_pool": res.qr_pool.stats() if res.qr_pool is not None else None,
+        "startup": {
+            "import_ms": IMPORT_SECONDS * 1000,
+            "startup_ms": res.startup_seconds * 1000,
+            "warm_up_ms": res.warm_up_seconds * 1000,
+        },
+    }
+
 # --- Ручка для генерации QR-кода ---
-@app.get("/show")
-async def show_qr_kod(request: Request, current_user: UserInDB = Depends(get_current_user)):
+@router.get("/show")
+async def show_qr_kod(
+    request: Request,
+    inline: bool = False,
+    fmt: str = "png",
+    current_user: CurrentUser = Depends(get_current_user),
+    res: Resources = Depends(get_resources)):
+    if fmt not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Неподдерживаемый формат QR-кода")
     try:
-        qr_code_path, qr_key = create_qr_code_with_key()
-        if qr_code_path and os.path.exists(qr_code_path):
+        if QR_RENDER_MODE == "file":
+            qr_code_path, qr_key = create_qr_code_with_key()
+            if not (qr_code_path and os.path.exists(qr_code_path)):
+                raise HTTPException(status_code=500, detail="Не удалось сгенерировать QR-код")
             qr_code_url = f"{request.url.scheme}://{request.url.hostname}:{request.url.port}/QRfolder/{os.path.basename(qr_code_path)}"
-            life_time = 60
-            try:
-                db.cursor.execute(
-                    "UPDATE users SET qr_code = ?, life_time = ? WHERE login = ?",
-                    (qr_key, life_time, current_user.login)
-                )
-                db.connection.commit()
-                logger.info(f"Ключ {qr_key} записан для пользователя {current_user.login}")
-            except Exception as e:
-                logger.error(f"Ошибка при обновлении данных пользователя: {e}")
-                raise HTTPException(status_code=500, detail="Ошибка при обновлении данных пользователя")
-            asyncio.create_task(remove_qr_code_after_delay(qr_code_path))
-            return {"qr_code": qr_code_url}
+        elif fmt == "png":
+            qr_bytes, qr_key = await res.qr_pool.get()
         else:
-            raise HTTPException(status_code=500, detail="Не удалось сгенерировать QR-код")
+            qr_bytes, qr_key = await asyncio.to_thread(create_qr_code_in_memory, fmt)
+        await save_qr_key(res, qr_key, current_user.login)
+        if QR_RENDER_MODE == "file":
+            # Файл удалит фоновая уборка, когда истечёт QR_LIFE_TIME
+            return {"qr_code": qr_code_url}
+        if inline:
+            return Response(content=qr_bytes, media_type=MEDIA_TYPES[fmt], headers={"Cache-Control": "no-store"})
+        qr_id = uuid.uuid4().hex
+        await res.shared_state.put_image(qr_id, qr_bytes, MEDIA_TYPES[fmt], QR_LIFE_TIME)
+        return {"qr_code": str(request.url_for("get_qr_image", qr_id=qr_id))}
     except Exception as e:
         logger.error(f"Ошибка при генерации QR-кода: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def remove_qr_code_after_delay(qr_code_path):
+async def save_qr_key(res: Resources, qr_key: str, login: str):
     try:
-        await asyncio.sleep(60)
-        if os.path.exists(qr_code_path):
-            os.remove(qr_code_path)
-            logger.info(f"QR-код {qr_code_path} удален.")
+        await res.db.run(res.key_store.issue, login, qr_key)
+        logger.info(f"Ключ {qr_key} записан для пользователя {login}")
     except Exception as e:
-        logger.error(f"Ошибка при удалении QR-кода: {e}")
+        logger.error(f"Ошибка при обновлении данных пользователя: {e}")
+        raise HTTPException(status_code=500, detail="Ошибка при обновлении данных пользователя")
 
-@app.post("/auth/register")
-async def register_user(request: UserRegisterRequest):
+# --- Отдача QR-кода из памяти ---
+@router.get("/qr/{qr_id}", name="get_qr_image")
+async def get_qr_image(qr_id: str, res: Resources = Depends(get_resources)):
+    item = await res.shared_state.get_image(qr_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="QR-код не найден или истёк")
+    content, media_type = item
+    return Response(content=content, media_type=media_type, headers={"Cache-Control": "no-store"})
+
+@router.post("/auth/register")
+async def register_user(request: UserRegisterRequest, res: Resources = Depends(get_resources)):
     try:
-        success = db.register_user(request.login, request.password)
+        hashed_password = await res.password_hasher.hash(request.password)
+        success = await res.db.run(res.db.create_user, request.login, hashed_password)
         if success:
             return {"status": "success", "message": "Пользователь успешно зарегистрирован"}
         else:
             raise HTTPException(status_code=400, detail="Пользователь с таким логином уже существует")
+    except PasswordPoolBusy:
+        raise HTTPException(status_code=503, detail="Сервер перегружен, повторите попытку позже")
     except Exception as e:
         logger.error(f"Ошибка при регистрации: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/take_image-bytes")
+@router.post(
+    "/take_image-bytes",
+    openapi_extra={"requestBody": {
+        "required": True,
+        "content": {"application/octet-stream": {"schema": {"type": "string", "format": "binary"}}},
+    }},
+)
 async def take_image_bytes(
+    request: Request,
     background_tasks: BackgroundTasks,
-    bytes_data: bytes = Body(..., media_type="application/octet-stream")):
+    wait: bool = False,
+    camera_id: str | None = Header(default=None, alias="X-Camera-Id"),
+    res: Resources = Depends(get_resources)):
+    received_at = time.perf_counter()
+    # Кадр читается потоком прямо в память, на диск он попадает только для аудита
+    frame = bytearray()
+    async for chunk in request.stream():
+        frame.extend(chunk)
+        if len(frame) > MAX_FRAME_BYTES:
+            raise HTTPException(status_code=413, detail="Слишком большое изображение")
+    if not frame:
+        raise HTTPException(status_code=400, detail="Пустое изображение")
+    try:
+        # Проверка ключа и открытие двери входят в задачу пула, чтобы дубликат
+        # кадра не погашал ключ второй раз, а получил тот же результат
+        processing = res.decode_pool.submit(frame, camera_id, functools.partial(
+            process_qr_text, key_store=res.key_store, door_registry=res.door_registry,
+            camera_id=camera_id, received_at=received_at))
+    except CameraBusy:
+        raise HTTPException(status_code=429, detail="Камера присылает кадры слишком часто", headers={"Retry-After": "1"})
+    except DecodePoolSaturated:
+        raise HTTPException(status_code=503, detail="Очередь распознавания переполнена", headers={"Retry-After": "1"})
     try:
-        os.makedirs("shot_images", exist_ok=True)
-        filename = f"{uuid.uuid4().hex}.png"
-        file_path = os.path.join("shot_images", filename)
-        with open(file_path, "wb") as f:
-            f.write(bytes_data)
-        # Запускаем обработку изображения в фоне
-        background_tasks.add_task(process_image_from_endpoint, file_path)
-        return {"status": "success", "message": "Изображение успешно сохранено"}
+        if SAVE_SHOT_IMAGES:
+            await asyncio.to_thread(save_frame, frame)
+        if wait:
+            result = await process_image_from_endpoint(processing)
+            return {"status": "success", **result}
+        # Результат распознавания обрабатывается в фоне
+        background_tasks.add_task(process_image_from_endpoint, processing)
+        return {"status": "success", "message": "Изображение принято"}
     except Exception as e:
-        logger.error(f"Ошибка при сохранении изображения: {e}")
-        raise HTTPException(status_code=500, detail=f"Ошибка при сохранении изображения: {str(e)}")
+        logger.error(f"Ошибка при обработке изображения: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при обработке изображения: {str(e)}")
+
+# --- Инициализация FastAPI ---
+def create_app() -> FastAPI:
+    """Создаёт приложение; база, пулы и фоновые задачи запускаются в lifespan"""
+    app = FastAPI(lifespan=lifespan)
+
+    # --- CORS ---
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.middleware("http")(timing_middleware)
+
+    # --- Статические файлы ---
+    # Папка с PNG есть только в режиме QR_RENDER_MODE=file
+    if QR_RENDER_MODE == "file":
+        os.makedirs(QR_FOLDER, exist_ok=True)
+        app.mount("/QRfolder", StaticFiles(directory=QR_FOLDER), name="QRfolder")
+
+    app.include_router(router)
+    return app
+
+app = create_app()
 
 # --- Запуск сервера ---
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
+    # Несколько воркеров: WEB_CONCURRENCY=4 python app.py
+    # или WEB_CONCURRENCY=4 gunicorn -k uvicorn.workers.UvicornWorker app:app
+    # (gunicorn берёт число воркеров из WEB_CONCURRENCY, а по нему же
+    # выбираются общее состояние в SQLite и размер пула распознавания)
+    if WEB_CONCURRENCY > 1:
+        uvicorn.run("app:create_app", factory=True, host="0.0.0.0", port=8000, workers=WEB_CONCURRENCY)
+    else:
+        uvicorn.run("app:create_app", factory=True, host="0.0.0.0", port=8000, reload=True)
@@ -1,50 +1,267 @@
+import os
 import sqlite3
-import bcrypt
+import asyncio
+import threading
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from passwords import hash_password, verify_password, UNUSABLE_PASSWORD
+from metrics import DB_QUERY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.environ.get("QR_DB_PATH", "users.db")
+DB_WORKERS = int(os.environ.get("DB_WORKERS", "8"))
+
+# Таблицы создаются один раз на файл базы, а не при каждом Database(...)
+_initialized_paths = set()
+_init_lock = threading.Lock()
 
 class Database:
-    def __init__(self, db_name="users.db"):
-        self.connection = sqlite3.connect(db_name)
-        self.cursor = self.connection.cursor()
+    """Доступ к SQLite с отдельным соединением на каждый поток.
+
+    Синхронные методы можно вызывать из любого потока, а из асинхронного
+    кода — через ``await db.run(...)``, чтобы не блокировать event loop.
+    """
+
+    def __init__(self, db_name=DB_PATH, workers=DB_WORKERS):
+        self.db_name = db_name
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
         self.create_table()
 
+    def _connect(self):
+        connection = sqlite3.connect(
+            self.db_name,
+            timeout=30,
+            check_same_thread=False,
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connections_lock:
+            self._connections.append(connection)
+        return connection
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    @property
+    def cursor(self):
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self._local.cursor = self.connection.cursor()
+        return cursor
+
     def _get_connection(self):
         return self.connection
 
+    async def run(self, func, *args, **kwargs):
+        """Выполняет синхронный вызов в пуле потоков базы данных"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._timed, func, *args, **kwargs))
+
+    @staticmethod
+    def _timed(func, *args, **kwargs):
+        with DB_QUERY_SECONDS.time(operation=getattr(func, "__name__", "unknown")):
+            return func(*args, **kwargs)
+
     def create_table(self):
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                login TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                qr_code TEXT,
-                life_time INTEGER
+        path = os.path.abspath(self.db_name)
+        with _init_lock:
+            if path in _initialized_paths:
+                return
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    login TEXT UNIQUE NOT NULL,
+                    password TEXT NOT NULL,
+                    qr_code TEXT,
+                    life_time INTEGER
+                )
+            ''')
+            # Одноразовые ключи QR-кодов с абсолютным временем истечения
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS qr_keys (
+                    qr_key TEXT PRIMARY KEY,
+                    login TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_qr_keys_login ON qr_keys (login)")
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_qr_keys_expires_at ON qr_keys (expires_at)")
+            # Общее состояние для нескольких воркеров: QR-изображения,
+            # отозванные токены и аренда фоновых задач
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS qr_images (
+                    qr_id TEXT PRIMARY KEY,
+                    content BLOB NOT NULL,
+                    media_type TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS revoked_tokens (
+                    token_hash TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL,
+                    revoked_at REAL NOT NULL
+                )
+            ''')
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_revoked_tokens_revoked_at ON revoked_tokens (revoked_at)")
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            self.connection.commit()
+            _initialized_paths.add(path)
+
+    def get_user(self, login: str):
+        """Возвращает (login, password) или None"""
+        return self.connection.execute(
+            "SELECT login, password FROM users WHERE login = ?", (login,)
+        ).fetchone()
+
+    def issue_qr_key(self, login: str, qr_key: str, expires_at: float) -> list:
+        """Сохраняет новый ключ пользователя и отзывает предыдущие.
+
+        Возвращает список отозванных ключей.
+        """
+        with self.connection as conn:
+            revoked = [row[0] for row in conn.execute(
+                "SELECT qr_key FROM qr_keys WHERE login = ?", (login,)
+            )]
+            conn.execute("DELETE FROM qr_keys WHERE login = ?", (login,))
+            conn.execute(
+                "INSERT INTO qr_keys (qr_key, login, expires_at) VALUES (?, ?, ?)",
+                (qr_key, login, expires_at)
             )
-        ''')
-        self.connection.commit()
+        return revoked
+
+    def consume_qr_key(self, qr_key: str, now: float):
+        """Погашает действующий ключ и возвращает логин владельца или None"""
+        with self.connection as conn:
+            row = conn.execute(
+                "SELECT login FROM qr_keys WHERE qr_key = ? AND expires_at > ?", (qr_key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            deleted = conn.execute(
+                "DELETE FROM qr_keys WHERE qr_key = ? AND expires_at > ?", (qr_key, now)
+            ).rowcount
+        return row[0] if deleted else None
+
+    def delete_qr_key(self, qr_key: str, now: float) -> bool:
+        with self.connection as conn:
+            return conn.execute(
+                "DELETE FROM qr_keys WHERE qr_key = ? AND expires_at > ?", (qr_key, now)
+            ).rowcount > 0
+
+    def purge_expired_keys(self, now: float) -> int:
+        with self.connection as conn:
+            return conn.execute("DELETE FROM qr_keys WHERE expires_at <= ?", (now,)).rowcount
+
+    def put_qr_image(self, qr_id: str, content: bytes, media_type: str, expires_at: float):
+        with self.connection as conn:
+            conn.execute(
+                "INSERT INTO qr_images (qr_id, content, media_type, expires_at) VALUES (?, ?, ?, ?)",
+                (qr_id, content, media_type, expires_at)
+            )
+
+    def get_qr_image(self, qr_id: str, now: float):
+        """Возвращает (content, media_type) или None"""
+        return self.connection.execute(
+            "SELECT content, media_type FROM qr_images WHERE qr_id = ? AND expires_at > ?", (qr_id, now)
+        ).fetchone()
+
+    def revoke_token(self, token_hash: str, expires_at: float, now: float):
+        with self.connection as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO revoked_tokens (token_hash, expires_at, revoked_at) VALUES (?, ?, ?)",
+                (token_hash, expires_at, now)
+            )
+
+    def revoked_tokens_since(self, since: float) -> list:
+        """Возвращает [(token_hash, expires_at, revoked_at)], отозванные после since"""
+        return self.connection.execute(
+            "SELECT token_hash, expires_at, revoked_at FROM revoked_tokens WHERE revoked_at > ?", (since,)
+        ).fetchall()
+
+    def acquire_lease(self, name: str, owner: str, now: float, ttl: float) -> bool:
+        """Берёт или продлевает аренду, если она свободна, истекла или уже принадлежит owner"""
+        with self.connection as conn:
+            return conn.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+                (name, owner, now + ttl, now)
+            ).rowcount > 0
+
+    def purge_shared_state(self, now: float) -> int:
+        with self.connection as conn:
+            removed = conn.execute("DELETE FROM qr_images WHERE expires_at <= ?", (now,)).rowcount
+            removed += conn.execute("DELETE FROM revoked_tokens WHERE expires_at <= ?", (now,)).rowcount
+        return removed
 
     def register_user(self, login: str, password: str) -> bool:
+        return self.create_user(login, hash_password(password))
+
+    def create_user(self, login: str, hashed_password: str) -> bool:
+        """Добавляет пользователя с уже захешированным паролем"""
         try:
-            hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
             self.cursor.execute("SELECT * FROM users WHERE login = ?", (login,))
             if self.cursor.fetchone() is not None:
-                print(f"Пользователь с логином {login} уже существует")
+                logger.info(f"Пользователь с логином {login} уже существует")
                 return False
             else:
                 self.cursor.execute("INSERT INTO users (login, password) VALUES (?, ?)", (login, hashed_password))
                 self.connection.commit()
-                print(f"Пользователь {login} успешно зарегистрирован")
+                logger.info(f"Пользователь {login} успешно зарегистрирован")
                 return True
         except Exception as e:
-            print(f"Ошибка при регистрации: {e}")
+            logger.error(f"Ошибка при регистрации: {e}")
             return False
 
+    def bulk_upsert_users(self, users) -> int:
+        """Добавляет или обновляет пользователей одной транзакцией.
+
+        users — пары (login, hashed_password); при hashed_password=None
+        существующий пароль не меняется, а новый пользователь получает
+        пароль, по которому войти нельзя.
+        """
+        with_password = [(login, hashed) for login, hashed in users if hashed is not None]
+        without_password = [(login, UNUSABLE_PASSWORD) for login, hashed in users if hashed is None]
+        with self.connection as conn:
+            conn.executemany(
+                "INSERT INTO users (login, password) VALUES (?, ?) "
+                "ON CONFLICT(login) DO UPDATE SET password = excluded.password",
+                with_password
+            )
+            conn.executemany(
+                "INSERT INTO users (login, password) VALUES (?, ?) ON CONFLICT(login) DO NOTHING",
+                without_password
+            )
+        return len(with_password) + len(without_password)
+
     def authenticate_user(self, login: str, password: str):
         self.cursor.execute("SELECT password FROM users WHERE login = ?", (login,))
         stored_password = self.cursor.fetchone()
         
-        if stored_password and bcrypt.checkpw(password.encode('utf-8'), stored_password[0]):
+        if stored_password and verify_password(password, stored_password[0]):
             return login
         return None
 
     def close(self):
-        self.connection.close()
+        self._executor.shutdown(wait=True)
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
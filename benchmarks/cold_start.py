@@ -0,0 +1,110 @@
+"""Холодный старт: время импорта app.py и время до первого ответа сервера.
+
+Импорт замеряется в отдельном интерпретаторе, чтобы модули не были уже
+загружены. Время до первого ответа — от запуска процесса uvicorn до
+первого 200 на /stats и, отдельно, до завершения фонового прогрева.
+
+Пример: python -m benchmarks.cold_start --runs 5 --output cold_start.json
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+from benchmarks.common import ROOT, summarize, print_summary, write_json
+from benchmarks.workers_scaling import free_port
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import app; print(time.perf_counter() - started)"
+
+def server_env(workdir, warm_up):
+    return dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        QR_DB_PATH=os.path.join(workdir, "users.db"),
+        WEB_CONCURRENCY="1",
+        DOOR_DEBUG="1",
+        WARM_UP="1" if warm_up else "0",
+    )
+
+def measure_import(warm_up):
+    workdir = tempfile.mkdtemp(prefix="qr_bench_")
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=workdir, env=server_env(workdir, warm_up), capture_output=True, text=True, check=True,
+    )
+    return float(output.stdout.strip().splitlines()[-1])
+
+def measure_first_response(warm_up, timeout=60):
+    """Возвращает (секунды до первого 200, секунды до конца прогрева или None)"""
+    workdir = tempfile.mkdtemp(prefix="qr_bench_")
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:create_app", "--factory", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=workdir, env=server_env(workdir, warm_up),
+    )
+    url = f"http://127.0.0.1:{port}/stats"
+    first_response = warmed_up = None
+    try:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                response = httpx.get(url, timeout=1)
+            except httpx.HTTPError:
+                time.sleep(0.01)
+                continue
+            if response.status_code != 200:
+                time.sleep(0.01)
+                continue
+            if first_response is None:
+                first_response = time.perf_counter() - started
+            if not warm_up:
+                break
+            stats = response.json()
+            if stats["startup"]["warm_up_ms"] > 0:
+                warmed_up = time.perf_counter() - started
+                break
+            time.sleep(0.05)
+    finally:
+        process.terminate()
+        process.wait()
+    if first_response is None:
+        raise RuntimeError("Сервер не запустился")
+    return first_response, warmed_up
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--no-warm-up", action="store_true", help="запускать сервер с WARM_UP=0")
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    args = parser.parse_args()
+    warm_up = not args.no_warm_up
+
+    imports, first_responses, warm_ups = [], [], []
+    for _ in range(args.runs):
+        imports.append(measure_import(warm_up))
+        first_response, warmed_up = measure_first_response(warm_up)
+        first_responses.append(first_response)
+        if warmed_up is not None:
+            warm_ups.append(warmed_up)
+
+    results = {
+        "import_app": summarize(imports),
+        "first_response": summarize(first_responses),
+        "params": vars(args),
+    }
+    if warm_ups:
+        results["warm_up_done"] = summarize(warm_ups)
+    for name in ("import_app", "first_response", "warm_up_done"):
+        if name in results:
+            print_summary(name, results[name])
+    if args.output:
+        write_json(args.output, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Общие помощники для бенчмарков.
+
+Бенчмарки запускаются из корня репозитория: ``python -m benchmarks.<имя>``.
+"""
+import os
+import sys
+import json
+import tempfile
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+# load_app меняет рабочий каталог, относительные пути результатов считаются от исходного
+START_DIR = os.getcwd()
+
+def percentile(values, q):
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def summarize(latencies, elapsed=None):
+    """Сводка по списку задержек в секундах; результат в миллисекундах"""
+    summary = {
+        "count": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies, default=0.0) * 1000,
+    }
+    if elapsed:
+        summary["throughput_rps"] = len(latencies) / elapsed
+    return summary
+
+def print_summary(name, summary):
+    parts = [f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+             for key, value in summary.items()]
+    print(f"{name:<24} " + " ".join(parts))
+
+def write_json(path, results):
+    path = os.path.join(START_DIR, path)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {path}")
+
+def load_app(**env):
+    """Импортирует app.py во временном каталоге с отдельной базой данных.
+
+    Переменные окружения из ``env`` выставляются до импорта, поэтому ими
+    можно переопределить любую настройку сервера.
+    """
+    workdir = tempfile.mkdtemp(prefix="qr_bench_")
+    os.chdir(workdir)
+    os.environ["QR_DB_PATH"] = os.path.join(workdir, "users.db")
+    for key, value in env.items():
+        os.environ[key] = str(value)
+    return importlib.import_module("app")
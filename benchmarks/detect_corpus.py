@@ -0,0 +1,81 @@
+"""Задержка и доля распознанных кадров для стратегий поиска QR-кода.
+
+Кадры синтетические: QR-коды из generator накладываются на шумовой фон
+примерно в одно и то же место для каждой камеры, как у закреплённой
+камеры на входе. Часть кадров без кода.
+
+Пример: python -m benchmarks.detect_corpus --cameras 4 --frames 50
+"""
+import time
+import random
+import argparse
+
+from benchmarks.common import summarize, print_summary, write_json
+from benchmarks.frames import composite_frame
+from generator import generate_qr_key, render_qr_bytes
+from qr_decode import open_image, detect_qr
+
+STRATEGY_SETS = {
+    "full": ("full",),
+    "downscale": ("downscale", "full"),
+    "roi": ("roi", "downscale", "full"),
+}
+
+def make_corpus(cameras, frames, size, empty_ratio, seed):
+    """Возвращает список (camera_id, байты JPEG-кадра, ожидаемый ключ или None)"""
+    rng = random.Random(seed)
+    width, height = size
+    corpus = []
+    for camera in range(cameras):
+        anchor = (rng.randint(0, width - 420), rng.randint(0, height - 420))
+        for _ in range(frames):
+            key = generate_qr_key() if rng.random() >= empty_ratio else None
+            frame = composite_frame(
+                render_qr_bytes(key) if key is not None else None,
+                size,
+                (anchor[0] + rng.randint(-20, 20), anchor[1] + rng.randint(-20, 20)),
+                noise=rng.uniform(20, 60),
+                scale=rng.uniform(0.6, 1.0),
+            )
+            corpus.append((f"camera-{camera}", frame, key))
+    return corpus
+
+def run_strategy(corpus, strategies):
+    latencies, hits, expected, stages = [], 0, 0, {}
+    roi_by_camera = {}
+    for camera_id, frame, key in corpus:
+        started = time.perf_counter()
+        text, bbox, stage = detect_qr(open_image(frame), roi_by_camera.get(camera_id), strategies)
+        latencies.append(time.perf_counter() - started)
+        if bbox is not None:
+            roi_by_camera[camera_id] = bbox
+            stages[stage] = stages.get(stage, 0) + 1
+        if key is not None:
+            expected += 1
+            hits += text == key
+    summary = summarize(latencies)
+    summary["hit_rate"] = hits / expected if expected else 0.0
+    summary["stage_hits"] = stages
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cameras", type=int, default=4)
+    parser.add_argument("--frames", type=int, default=50, help="кадров на камеру")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--empty-ratio", type=float, default=0.2, help="доля кадров без QR-кода")
+    parser.add_argument("--seed", type=int, default=2025)
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.cameras, args.frames, (args.width, args.height), args.empty_ratio, args.seed)
+    results = {"params": vars(args)}
+    for name, strategies in STRATEGY_SETS.items():
+        results[name] = run_strategy(corpus, strategies)
+        print_summary(name, results[name])
+    if args.output:
+        write_json(args.output, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Нагрузочный тест всего сценария прохода.
+
+Сервер поднимается в этом же процессе с временной базой и имитатором
+замка. N пользователей проходят register -> /token -> /show -> /qr/{id},
+затем M камер отправляют на /take_image-bytes кадры с полученными
+QR-кодами (и пустые кадры) и ждут результата распознавания. Для каждого
+эндпоинта выводятся p50/p95/p99 и пропускная способность, итог пишется
+в JSON.
+
+Пример: python -m benchmarks.entry_flow --users 200 --cameras 4 --output entry_flow.json
+"""
+import time
+import random
+import asyncio
+import argparse
+
+import httpx
+
+from benchmarks.common import load_app, summarize, print_summary, write_json
+from benchmarks.frames import composite_frame
+from fake_lock import FakeLockServer
+
+FRAME_SIZE = (1280, 720)
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    async def request(self, name, send):
+        started = time.perf_counter()
+        response = await send()
+        if response.status_code >= 400:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        else:
+            self.latencies.setdefault(name, []).append(time.perf_counter() - started)
+        return response
+
+async def user_flow(client, recorder, index, semaphore):
+    login, password = f"user{index}", "bench-password"
+    async with semaphore:
+        await recorder.request("/auth/register", lambda: client.post(
+            "/auth/register", json={"login": login, "password": password}))
+        response = await recorder.request("/token", lambda: client.post(
+            "/token", data={"username": login, "password": password}))
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        response = await recorder.request("/show", lambda: client.get("/show", headers=headers))
+        url = response.json()["qr_code"]
+        response = await recorder.request("/qr/{qr_id}", lambda: client.get(url))
+        return response.content
+
+async def camera_flow(client, recorder, camera_id, frames, results):
+    headers = {"X-Camera-Id": camera_id, "Content-Type": "application/octet-stream"}
+    for frame in frames:
+        response = await recorder.request("/take_image-bytes", lambda: client.post(
+            "/take_image-bytes", params={"wait": "true"}, content=frame, headers=headers))
+        if response.status_code == 200:
+            body = response.json()
+            results["frames"] += 1
+            results["granted"] += body.get("access_granted", False)
+            results["no_qr"] += not body.get("qr_found", False)
+
+def build_frames(qr_images, cameras, empty_ratio, rng):
+    """Раскладывает QR-коды по камерам и добавляет пустые кадры"""
+    anchors = [(rng.randint(0, FRAME_SIZE[0] - 420), rng.randint(0, FRAME_SIZE[1] - 420)) for _ in range(cameras)]
+    frames = [[] for _ in range(cameras)]
+    for index, qr_png in enumerate(qr_images):
+        camera = index % cameras
+        if rng.random() < empty_ratio:
+            frames[camera].append(composite_frame(None, FRAME_SIZE, anchors[camera], noise=40))
+        x, y = anchors[camera]
+        position = (x + rng.randint(-20, 20), y + rng.randint(-20, 20))
+        frames[camera].append(composite_frame(qr_png, FRAME_SIZE, position, noise=40, scale=rng.uniform(0.7, 1.0)))
+    return frames
+
+async def run(args):
+    rng = random.Random(args.seed)
+    async with FakeLockServer() as lock:
+        doors = ",".join(f"camera-{i}=127.0.0.1:{lock.port}" for i in range(args.cameras))
+        app_module = load_app(DOORS=doors, BCRYPT_ROUNDS=args.rounds)
+        app = app_module.app
+        async with app.router.lifespan_context(app):
+            recorder = Recorder()
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+                semaphore = asyncio.Semaphore(args.concurrency)
+                started = time.perf_counter()
+                qr_images = await asyncio.gather(*(
+                    user_flow(client, recorder, i, semaphore) for i in range(args.users)
+                ))
+                users_elapsed = time.perf_counter() - started
+
+                frames = build_frames(qr_images, args.cameras, args.empty_ratio, rng)
+                results = {"frames": 0, "granted": 0, "no_qr": 0}
+                started = time.perf_counter()
+                await asyncio.gather(*(
+                    camera_flow(client, recorder, f"camera-{i}", camera_frames, results)
+                    for i, camera_frames in enumerate(frames)
+                ))
+                cameras_elapsed = time.perf_counter() - started
+
+    report = {"params": vars(args), "endpoints": {}, "errors": recorder.errors, "scan": results,
+              "door_commands": len(lock.commands)}
+    for name, latencies in recorder.latencies.items():
+        elapsed = cameras_elapsed if name == "/take_image-bytes" else users_elapsed
+        report["endpoints"][name] = summarize(latencies, elapsed)
+        print_summary(name, report["endpoints"][name])
+    print(f"Кадров: {results['frames']}, открытий: {results['granted']}, без QR: {results['no_qr']}, "
+          f"ошибок: {recorder.errors}")
+    if args.output:
+        write_json(args.output, report)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--cameras", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=32, help="пользователей одновременно")
+    parser.add_argument("--empty-ratio", type=float, default=0.2, help="доля дополнительных пустых кадров")
+    parser.add_argument("--rounds", type=int, default=4, help="стоимость bcrypt")
+    parser.add_argument("--seed", type=int, default=2025)
+    parser.add_argument("--output", default="entry_flow_results.json", help="файл для результатов в JSON")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+"""Синтетические кадры камер с наложенным QR-кодом"""
+import io
+
+from PIL import Image
+
+def composite_frame(qr_png, size, position, noise, scale=1.0, quality=90):
+    """Накладывает QR-код (PNG-байты или None) на шумовой фон и кодирует кадр в JPEG"""
+    background = Image.effect_noise(size, noise).convert("RGB")
+    if qr_png is not None:
+        qr = Image.open(io.BytesIO(qr_png)).convert("RGB")
+        side = int(qr.width * scale)
+        qr = qr.resize((side, side))
+        x = min(size[0] - side, max(0, position[0]))
+        y = min(size[1] - side, max(0, position[1]))
+        background.paste(qr, (x, y))
+    buffer = io.BytesIO()
+    background.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
@@ -0,0 +1,68 @@
+"""Генерация и распознавание QR-кодов: старый формат ключа против нового.
+
+Старый формат — 12 случайных символов из букв, цифр и пунктуации с
+подбором версии (fit=True); новый — base32 из generator с фиксированной
+версией. Распознавание замеряется на тех же PNG через qr_decode.
+
+Пример: python -m benchmarks.key_format --count 500
+"""
+import io
+import time
+import random
+import string
+import argparse
+
+import qrcode
+
+from benchmarks.common import summarize, print_summary, write_json
+from generator import generate_qr_key, render_qr_bytes
+from qr_decode import open_image, detect_qr
+
+def legacy_key():
+    characters = string.ascii_letters + string.digits + string.punctuation
+    return ''.join(random.choice(characters) for _ in range(12))
+
+def legacy_render(data):
+    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
+    qr.add_data(data)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+SCHEMES = {
+    "legacy": (legacy_key, legacy_render),
+    "base32": (generate_qr_key, render_qr_bytes),
+}
+
+def run_scheme(make_key, render, count):
+    generate, decode, hits = [], [], 0
+    for _ in range(count):
+        started = time.perf_counter()
+        key = make_key()
+        png = render(key)
+        generate.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        text, _, _ = detect_qr(open_image(png), None, ("full",))
+        decode.append(time.perf_counter() - started)
+        hits += text == key
+    return {"generate": summarize(generate), "decode": summarize(decode), "hit_rate": hits / count}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    args = parser.parse_args()
+
+    results = {"params": vars(args)}
+    for name, (make_key, render) in SCHEMES.items():
+        results[name] = run_scheme(make_key, render, args.count)
+        print_summary(f"{name} generate", results[name]["generate"])
+        print_summary(f"{name} decode", results[name]["decode"])
+        print(f"{name} hit_rate={results[name]['hit_rate']:.3f}")
+    if args.output:
+        write_json(args.output, results)
+
+if __name__ == "__main__":
+    main()
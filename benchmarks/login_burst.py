@@ -0,0 +1,69 @@
+"""Задержка /show во время потока логинов на /token.
+
+Пример: python -m benchmarks.login_burst --concurrency 32 --duration 10
+"""
+import time
+import asyncio
+import argparse
+
+import httpx
+
+from benchmarks.common import load_app, summarize, print_summary, write_json
+
+async def measure_show(client, headers, deadline, latencies):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.get("/show", headers=headers)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+async def hammer_token(client, deadline, latencies):
+    form = {"username": "bench", "password": "bench-password"}
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.post("/token", data=form)
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - started)
+
+async def run(args):
+    app_module = load_app(BCRYPT_ROUNDS=args.rounds)
+    app = app_module.app
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/auth/register", json={"login": "bench", "password": "bench-password"})
+        response.raise_for_status()
+        response = await client.post("/token", data={"username": "bench", "password": "bench-password"})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        baseline = []
+        deadline = time.perf_counter() + args.duration
+        await measure_show(client, headers, deadline, baseline)
+
+        under_burst, token_latencies = [], []
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(
+            measure_show(client, headers, deadline, under_burst),
+            *(hammer_token(client, deadline, token_latencies) for _ in range(args.concurrency)),
+        )
+
+    results = {
+        "show_baseline": summarize(baseline, args.duration),
+        "show_under_login_burst": summarize(under_burst, args.duration),
+        "token": summarize(token_latencies, args.duration),
+        "params": vars(args),
+    }
+    for name in ("show_baseline", "show_under_login_burst", "token"):
+        print_summary(name, results[name])
+    if args.output:
+        write_json(args.output, results)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=32, help="параллельных логинов")
+    parser.add_argument("--duration", type=float, default=10.0, help="длительность каждой фазы, с")
+    parser.add_argument("--rounds", type=int, default=12, help="стоимость bcrypt")
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
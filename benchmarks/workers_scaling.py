@@ -0,0 +1,119 @@
+"""Пропускная способность /show в зависимости от числа воркеров uvicorn.
+
+Для каждого значения --workers поднимается отдельный сервер с общим
+состоянием в SQLite, а нагрузку создают несколько клиентских процессов.
+
+Пример: python -m benchmarks.workers_scaling --workers 1 2 4 --duration 10
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+import httpx
+
+from benchmarks.common import ROOT, summarize, print_summary, write_json
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(workers, port):
+    workdir = tempfile.mkdtemp(prefix="qr_bench_")
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        QR_DB_PATH=os.path.join(workdir, "users.db"),
+        WEB_CONCURRENCY=str(workers),
+        SHARED_STATE_BACKEND="sqlite",
+        DOOR_DEBUG="1",
+        BCRYPT_ROUNDS="4",
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/stats", timeout=1).raise_for_status()
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Сервер не запустился")
+
+def create_tokens(base_url, users):
+    tokens = []
+    with httpx.Client(base_url=base_url) as client:
+        for i in range(users):
+            credentials = {"login": f"user{i}", "password": "bench-password"}
+            client.post("/auth/register", json=credentials)
+            response = client.post("/token", data={"username": credentials["login"], "password": credentials["password"]})
+            response.raise_for_status()
+            tokens.append(response.json()["access_token"])
+    return tokens
+
+async def _client_loop(base_url, tokens, duration, concurrency):
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def user(token):
+        headers = {"Authorization": f"Bearer {token}"}
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await client.get("/show", headers=headers)
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        await asyncio.gather(*(user(tokens[i % len(tokens)]) for i in range(concurrency)))
+    return latencies
+
+def client_process(base_url, tokens, duration, concurrency):
+    return asyncio.run(_client_loop(base_url, tokens, duration, concurrency))
+
+def run_level(workers, args):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = start_server(workers, port)
+    try:
+        tokens = create_tokens(base_url, args.users)
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.starmap(
+                client_process,
+                [(base_url, tokens, args.duration, args.concurrency)] * args.clients,
+            )
+    finally:
+        process.terminate()
+        process.wait()
+    latencies = [latency for result in results for latency in result]
+    return summarize(latencies, args.duration)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--clients", type=int, default=4, help="клиентских процессов")
+    parser.add_argument("--concurrency", type=int, default=32, help="параллельных запросов на клиента")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    args = parser.parse_args()
+
+    results = {"params": vars(args)}
+    for workers in args.workers:
+        results[f"workers_{workers}"] = run_level(workers, args)
+        print_summary(f"workers={workers}", results[f"workers_{workers}"])
+    if args.output:
+        write_json(args.output, results)
+
+if __name__ == "__main__":
+    main()
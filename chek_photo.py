@@ -1,97 +1,95 @@
 import os
-import time
-import asyncio
-from PIL import Image
-from pyzbar.pyzbar import decode
-from bd import Database
-from door_lock import DoorLock
+import uuid
+from key_store import KeyStore
+from door_lock import DoorRegistry
+from generator import verify_qr_key
+from maintenance import sweep_folder
+from metrics import ACCESS_GRANTED, ACCESS_DENIED, FRAMES_WITHOUT_QR, FRAMES_WITH_USED_KEY
+from ttl_cache import TTLCache
 import logging
 
 # --- Настройка логирования ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-os.makedirs("shot_images", exist_ok=True)
-
 # Настройки
 IMAGE_FOLDER = "shot_images"
-MAX_AGE_NO_QR = 30
-DELETE_INTERVAL = 300  # 5 минут в секундах
+DELETE_INTERVAL = 300  # столько секунд хранятся кадры для аудита
+# Кадры с камер сохраняются на диск только для аудита
+SAVE_SHOT_IMAGES = os.environ.get("SAVE_SHOT_IMAGES", "0").lower() in ("1", "true", "yes")
+# Камера продолжает видеть телефон после открытия двери; такие кадры
+# с только что погашенным ключом не считаются отказами
+USED_KEY_TTL = 10
 
-def scan_qr_code(image_path):
-    """Сканирует QR-код на изображении и возвращает текст"""
-    try:
-        img = Image.open(image_path)
-        decoded_objects = decode(img)
-        if decoded_objects:
-            return decoded_objects[0].data.decode("utf-8")
-        return None
-    except Exception as e:
-        logger.error(f"Ошибка при обработке {image_path}: {e}")
-        return None
+_used_keys = TTLCache(maxsize=10000, ttl=USED_KEY_TTL)
 
-def check_key_in_db(qr_key: str) -> bool:
-    """Проверяет наличие ключа в базе данных"""
-    db = Database('users.db')
-    with db._get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE qr_code = ?", (qr_key,))
-        return cursor.fetchone() is not None
+def check_key_in_db(key_store: KeyStore, qr_key: str) -> bool:
+    """Проверяет и погашает одноразовый ключ"""
+    login = key_store.consume(qr_key)
+    if login is not None:
+        logger.info(f"Ключ принадлежит пользователю {login}")
+    return login is not None
 
-def scan_and_process_image(filepath):
-    """Обрабатывает одно конкретное изображение"""
-    qr_text = scan_qr_code(filepath)
-    
-    if qr_text:
-        logger.info(f"Найден QR-код в {os.path.basename(filepath)}: {qr_text}")
-        
-        # Проверяем ключ в базе данных
-        if check_key_in_db(qr_text):
-            logger.info("Ключ найден в базе данных. Открываем дверь.")
-            door_lock = DoorLock()
-            door_lock.open_door()
-            return True
-        else:
-            logger.warning("Ключ не найден в базе данных. Доступ запрещен.")
-            return False
-    else:
-        try:
-            os.remove(filepath)
-            logger.info(f"Удалено (нет QR-кода): {os.path.basename(filepath)}")
-        except Exception as e:
-            logger.error(f"Ошибка удаления {filepath}: {e}")
+async def handle_qr_text(qr_text: str, key_store: KeyStore, door_registry: DoorRegistry,
+                         door_id=None, received_at=None) -> bool:
+    """Проверяет ключ из QR-кода и открывает дверь, у которой стоит камера"""
+    if not verify_qr_key(qr_text):
+        logger.warning("Неверный формат или подпись ключа. Доступ запрещен.")
+        return False
+    # Дверь проверяется до погашения ключа: если открыть её сейчас нельзя,
+    # ключ остаётся действительным и сработает на следующем кадре
+    door = door_registry.get(door_id)
+    if door is None:
+        logger.warning(f"Камера {door_id} не привязана ни к одной двери. Доступ запрещен.")
         return False
+    if not await door.ready():
+        logger.warning(f"Дверь для камеры {door_id} недоступна, ключ не погашен")
+        return False
+    if await key_store.db.run(check_key_in_db, key_store, qr_text):
+        logger.info("Ключ найден в базе данных. Открываем дверь.")
+        return await door_registry.open(door_id, received_at)
+    logger.warning("Ключ не найден в базе данных. Доступ запрещен.")
+    return False
+
+def save_frame(frame) -> str:
+    """Сохраняет кадр в папку для аудита и возвращает путь к файлу"""
+    os.makedirs(IMAGE_FOLDER, exist_ok=True)
+    file_path = os.path.join(IMAGE_FOLDER, f"{uuid.uuid4().hex}.png")
+    with open(file_path, "wb") as f:
+        f.write(frame)
+    return file_path
 
-async def delit_image():
-    """Периодически очищает папку с изображениями"""
-    while True:
-        try:
-            await asyncio.sleep(DELETE_INTERVAL)
-            files = [
-                os.path.join(IMAGE_FOLDER, f) 
-                for f in os.listdir(IMAGE_FOLDER) 
-                if f.lower().endswith(('.png', '.jpg', '.jpeg'))
-            ]
-            for filepath in files:
-                try:
-                    os.remove(filepath)
-                    logger.info(f"Удален файл: {os.path.basename(filepath)}")
-                except Exception as e:
-                    logger.error(f"Ошибка при удалении {filepath}: {e}")
-            logger.info("Очистка папки shot_images завершена")
-        except Exception as e:
-            logger.error(f"Ошибка в процессе очистки папки: {e}")
+async def process_qr_text(qr_text, key_store: KeyStore, door_registry: DoorRegistry,
+                          camera_id=None, received_at=None) -> dict:
+    """Проверяет ключ из распознанного кадра и открывает дверь"""
+    if not qr_text:
+        FRAMES_WITHOUT_QR.inc()
+        return {"qr_found": False, "access_granted": False}
+    if qr_text in _used_keys:
+        FRAMES_WITH_USED_KEY.inc()
+        return {"qr_found": True, "access_granted": False, "key_already_used": True}
+    logger.info(f"Найден QR-код: {qr_text}")
+    granted = await handle_qr_text(qr_text, key_store, door_registry, camera_id, received_at)
+    if granted:
+        _used_keys.set(qr_text, True)
+        ACCESS_GRANTED.inc()
+    else:
+        ACCESS_DENIED.inc()
+    return {"qr_found": True, "access_granted": granted}
 
-async def process_image_from_endpoint(file_path: str):
-    """Обрабатывает изображение, полученное через эндпоинт"""
+async def process_image_from_endpoint(processing) -> dict:
+    """Дожидается распознавания и обработки кадра из DecodePool.submit.
+
+    Одинаковые кадры делят одну задачу, поэтому все запросы-дубликаты
+    получают тот же результат, а ключ проверяется один раз.
+    """
     try:
-        scan_and_process_image(file_path)
+        return await processing
     except Exception as e:
-        logger.error(f"Ошибка при обработке изображения {file_path}: {e}")
-
-async def start_delete_task():
-    """Запускает задачу очистки папки"""
-    asyncio.create_task(delit_image())
+        logger.error(f"Ошибка при обработке кадра: {e}")
+        return {"qr_found": False, "access_granted": False}
 
 if __name__ == "__main__":
-    asyncio.run(delit_image())
+    # Разовая очистка папки кадров; на сервере её делает Maintenance
+    removed = sweep_folder(IMAGE_FOLDER, DELETE_INTERVAL)
+    logger.info(f"Очистка папки {IMAGE_FOLDER} завершена, удалено файлов: {removed}")
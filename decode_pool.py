@@ -0,0 +1,195 @@
+import os
+import time
+import asyncio
+import hashlib
+import importlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import QR_DECODE_SECONDS, FRAMES_DROPPED, DECODE_POOL_RESTARTS
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Ядра делятся между веб-воркерами, у каждого из которых свой пул
+_web_workers = max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+DECODE_WORKERS = int(os.environ.get("DECODE_WORKERS", str(max(1, (os.cpu_count() or 1) // _web_workers))))
+# Сколько кадров может декодироваться или ждать очереди одновременно
+DECODE_QUEUE_LIMIT = int(os.environ.get("DECODE_QUEUE_LIMIT", str(DECODE_WORKERS * 4)))
+# Сколько кадров одной камеры может быть в работе одновременно
+DECODE_PER_CAMERA_LIMIT = int(os.environ.get("DECODE_PER_CAMERA_LIMIT", "2"))
+# Области последних найденных кодов: X-Camera-Id присылает клиент, поэтому
+# число камер ограничено, а область забывается, если камера давно молчит
+ROI_CACHE_SIZE = int(os.environ.get("ROI_CACHE_SIZE", "1024"))
+ROI_TTL = 600
+
+class FrameDropped(Exception):
+    """Кадр отброшен без декодирования"""
+
+class DecodePoolSaturated(FrameDropped):
+    """Пул декодирования переполнен"""
+
+class CameraBusy(FrameDropped):
+    """Камера присылает кадры быстрее, чем они декодируются"""
+
+class DecodePool:
+    """Пул процессов для pyzbar с ограниченной очередью.
+
+    Одинаковые кадры одной камеры, пришедшие пока предыдущий ещё
+    декодируется, не декодируются повторно, а получают тот же результат.
+    Для каждой камеры запоминается область, где код нашёлся в прошлый раз:
+    камеры закреплены, и следующий код скорее всего окажется там же.
+    """
+
+    def __init__(self, decode_func=None, workers=DECODE_WORKERS,
+                 queue_limit=DECODE_QUEUE_LIMIT, per_camera_limit=DECODE_PER_CAMERA_LIMIT):
+        self.decode_func = decode_func
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.per_camera_limit = per_camera_limit
+        self._executor = None
+        self._in_flight = 0
+        # camera_id -> {digest: task}
+        self._by_camera = {}
+        # camera_id -> (left, top, width, height)
+        self._roi = TTLCache(maxsize=ROI_CACHE_SIZE, ttl=ROI_TTL)
+        self.strategy_hits = {}
+        self.submitted = 0
+        self.decoded = 0
+        self.failed = 0
+        self.restarts = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.decode_time_total = 0.0
+        self.decode_time_max = 0.0
+
+    def _get_decode_func(self):
+        if self.decode_func is None:
+            # Стек распознавания загружается при первом кадре или прогреве
+            from qr_decode import decode_frame
+            self.decode_func = decode_frame
+        return self.decode_func
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn: дочерние процессы не наследуют потоки и соединения с базой
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def submit(self, frame, camera_id=None, handler=None) -> asyncio.Future:
+        """Ставит кадр в очередь и возвращает задачу с результатом.
+
+        Без handler результат — текст QR-кода, иначе — ``await handler(text)``.
+        Одинаковые кадры одной камеры получают одну задачу, поэтому и
+        обработка (проверка ключа, открытие двери) выполняется один раз.
+        Если пул или камера перегружены, сразу бросает FrameDropped.
+        """
+        camera_id = camera_id or "default"
+        digest = hashlib.blake2b(frame, digest_size=16).digest()
+        pending = self._by_camera.setdefault(camera_id, {})
+        if digest in pending:
+            self.coalesced += 1
+            return pending[digest]
+        if self._in_flight >= self.queue_limit:
+            self.dropped += 1
+            FRAMES_DROPPED.inc(reason="pool_saturated")
+            raise DecodePoolSaturated()
+        if len(pending) >= self.per_camera_limit:
+            self.dropped += 1
+            FRAMES_DROPPED.inc(reason="camera_busy")
+            raise CameraBusy()
+
+        self._in_flight += 1
+        self.submitted += 1
+        task = asyncio.ensure_future(self._process(bytes(frame), camera_id, digest, pending, handler))
+        pending[digest] = task
+        return task
+
+    async def _process(self, frame, camera_id, digest, pending, handler):
+        # Кадр считается в работе, пока не закончена и обработка результата:
+        # дубликат, пришедший во время открытия двери, получит тот же ответ
+        try:
+            text = await self._decode(frame, camera_id)
+            if handler is None:
+                return text
+            return await handler(text)
+        finally:
+            pending.pop(digest, None)
+            if not pending:
+                self._by_camera.pop(camera_id, None)
+
+    async def _decode(self, frame, camera_id):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        executor = self._get_executor()
+        try:
+            text, bbox, strategy = await loop.run_in_executor(
+                executor, self._get_decode_func(), frame, self._roi.get(camera_id)
+            )
+        except BrokenProcessPool:
+            # Процесс пула упал (segfault в zbar, OOM): следующий кадр поднимет новый пул
+            self.failed += 1
+            self._restart_executor(executor)
+            raise
+        except BaseException:
+            self.failed += 1
+            raise
+        else:
+            self.decoded += 1
+        finally:
+            elapsed = time.perf_counter() - started
+            self._in_flight -= 1
+            self.decode_time_total += elapsed
+            self.decode_time_max = max(self.decode_time_max, elapsed)
+            QR_DECODE_SECONDS.observe(elapsed)
+        if bbox is not None:
+            self._roi.set(camera_id, bbox)
+            self.strategy_hits[strategy] = self.strategy_hits.get(strategy, 0) + 1
+        return text
+
+    def _restart_executor(self, executor):
+        # Несколько кадров могут упасть на одном сломанном пуле, пересоздаётся он один раз
+        if self._executor is not executor:
+            return
+        logger.error("Пул распознавания сломан, будет создан новый")
+        self._executor = None
+        self.restarts += 1
+        DECODE_POOL_RESTARTS.inc()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def warm_up(self):
+        """Запускает процессы пула заранее, чтобы первый кадр не ждал их старта"""
+        loop = asyncio.get_running_loop()
+        await asyncio.to_thread(self._get_decode_func)
+        executor = self._get_executor()
+        # Каждый процесс заодно импортирует стек распознавания
+        await asyncio.gather(*(loop.run_in_executor(executor, _warm_up_worker) for _ in range(self.workers)))
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._in_flight,
+            "submitted": self.submitted,
+            "decoded": self.decoded,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+            "restarts": self.restarts,
+            "decode_time_avg_ms": self.decode_time_total / (self.decoded + self.failed) * 1000 if self.decoded + self.failed else 0.0,
+            "decode_time_max_ms": self.decode_time_max * 1000,
+            "strategy_hits": dict(self.strategy_hits),
+        }
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+def _warm_up_worker():
+    # Нужен только побочный эффект: модули распознавания загружаются в процесс пула
+    importlib.import_module("qr_decode")
+    return os.getpid()
@@ -1,34 +1,219 @@
-import socket
+import os
+import json
+import time
 import asyncio
+import logging
+
+from metrics import DOOR_ACK_SECONDS, UNLOCK_LATENCY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Время на одну команду целиком: подключение, отправка и ответ замка
+DOOR_COMMAND_TIMEOUT = float(os.environ.get("DOOR_COMMAND_TIMEOUT", "2.0"))
+DOOR_RECONNECT_MIN_DELAY = 0.5
+DOOR_RECONNECT_MAX_DELAY = 30.0
+DEFAULT_DOOR = "main"
+# Двери задаются строкой "main=10.10.22.6:9091,side=10.10.22.7:9091"
+# или JSON-файлом {"main": {"ip": "10.10.22.6", "port": 9091}}
+DOORS = os.environ.get("DOORS", f"{DEFAULT_DOOR}=10.10.22.6:9091")
+DOORS_FILE = os.environ.get("DOORS_FILE")
+DOOR_DEBUG = os.environ.get("DOOR_DEBUG", "0").lower() in ("1", "true", "yes")
 
 class DoorLock:
-    def __init__(self, ip_door="10.10.22.6", port_door=9091, debug=False):
+    """Клиент замка с постоянным соединением.
+
+    Замок подтверждает команду, возвращая её обратно. При обрыве соединения
+    клиент переподключается с экспоненциальной задержкой.
+    """
+
+    def __init__(self, ip_door="10.10.22.6", port_door=9091, debug=False, timeout=DOOR_COMMAND_TIMEOUT):
         self.ip_door = ip_door
         self.port_door = port_door
         self.debug = debug
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+        self._failures = 0
+        self._next_attempt = 0.0
+        self.commands = 0
+        self.errors = 0
+        self.ack_time_total = 0.0
 
     async def open_door(self):
-        await self.send_message("open")
+        return await self.send_message("open")
 
     async def disable_door(self):
-        await self.send_message("disable_door")
+        return await self.send_message("disable_door")
 
     async def enable_door(self):
-        await self.send_message("enable_door")
+        return await self.send_message("enable_door")
+
+    def available(self) -> bool:
+        """False, пока после неудачного подключения действует задержка переподключения"""
+        return self._writer is not None or time.monotonic() >= self._next_attempt
 
-    async def send_message(self, message):
-        if not self.debug:
+    async def ready(self) -> bool:
+        """Открывает соединение заранее. False, если замок сейчас недоступен"""
+        if self.debug:
+            return True
+        if not self.available():
+            return False
+        async with self._lock:
             try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                    sock.connect((self.ip_door, self.port_door))
-                    sock.sendall(message.encode('utf-8'))
-                    data = sock.recv(1024)
-                    print(data.decode('utf-8'))
-                    if data == message.encode('utf-8'):
-                        print("Команда дошла успешно")
-                    else:
-                        print("Что-то пошло не так")
-            except ConnectionRefusedError:
-                print("Соединение с дверью не установлено")
+                async with asyncio.timeout(self.timeout):
+                    await self._connect()
+            except (OSError, TimeoutError) as e:
+                await self._disconnect()
+                logger.error(f"Соединение с дверью {self.ip_door}:{self.port_door} не установлено: {e!r}")
+                return False
+        return True
+
+    async def _connect(self):
+        if self._writer is not None and not self._reader.at_eof():
+            return
+        await self._disconnect()
+        if time.monotonic() < self._next_attempt:
+            raise ConnectionError("переподключение отложено")
+        try:
+            self._reader, self._writer = await asyncio.open_connection(self.ip_door, self.port_door)
+        except (OSError, asyncio.CancelledError):
+            # CancelledError — истёк общий таймаут команды во время подключения
+            self._failures += 1
+            delay = min(DOOR_RECONNECT_MAX_DELAY, DOOR_RECONNECT_MIN_DELAY * 2 ** (self._failures - 1))
+            self._next_attempt = time.monotonic() + delay
+            raise
+        self._failures = 0
+
+    async def _disconnect(self):
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def send_message(self, message) -> bool:
+        """Отправляет команду и ждёт подтверждения. Возвращает True, если замок его прислал"""
+        if self.debug:
+            logger.info(f"Команда отправленная на дверь: {message}")
+            return True
+        data = message.encode('utf-8')
+        async with self._lock:
+            self.commands += 1
+            started = time.perf_counter()
+            try:
+                # Один таймаут на всю команду: подключение, отправку и ответ
+                async with asyncio.timeout(self.timeout):
+                    ack = await self._exchange(data)
+            except (OSError, TimeoutError, asyncio.IncompleteReadError) as e:
+                await self._disconnect()
+                self.errors += 1
+                logger.error(f"Соединение с дверью {self.ip_door}:{self.port_door} не установлено: {e!r}")
+                return False
+            if ack == data:
+                elapsed = time.perf_counter() - started
+                self.ack_time_total += elapsed
+                DOOR_ACK_SECONDS.observe(elapsed, door=f"{self.ip_door}:{self.port_door}")
+                logger.info("Команда дошла успешно")
+                return True
+            # Ответ не совпал — поток рассинхронизирован, соединение лучше открыть заново
+            await self._disconnect()
+            self.errors += 1
+            logger.warning(f"Что-то пошло не так: замок ответил {ack!r}")
+            return False
+
+    async def _exchange(self, data):
+        # Повтор только если замок закрыл постоянное соединение и не прислал
+        # ни байта ответа: тогда команда до него не дошла. После таймаута
+        # команда могла быть выполнена, и повторять её нельзя
+        for attempt in range(2):
+            reused = self._writer is not None
+            await self._connect()
+            try:
+                self._writer.write(data)
+                await self._writer.drain()
+                return await self._reader.readexactly(len(data))
+            except (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError) as e:
+                received = isinstance(e, asyncio.IncompleteReadError) and e.partial
+                if not reused or attempt or received:
+                    raise
+                await self._disconnect()
+
+    async def close(self):
+        async with self._lock:
+            await self._disconnect()
+
+    def stats(self) -> dict:
+        acked = self.commands - self.errors
+        return {
+            "address": f"{self.ip_door}:{self.port_door}",
+            "commands": self.commands,
+            "errors": self.errors,
+            "ack_time_avg_ms": self.ack_time_total / acked * 1000 if acked else 0.0,
+        }
+
+class DoorRegistry:
+    """Реестр дверей: идентификатор двери (он же идентификатор камеры) -> DoorLock"""
+
+    def __init__(self, doors: dict, default_door=DEFAULT_DOOR):
+        self.doors = doors
+        self.default_door = default_door
+        self.unlocks = 0
+        self.unlock_latency_total = 0.0
+        self.unlock_latency_max = 0.0
+
+    @classmethod
+    def from_config(cls, doors=DOORS, doors_file=DOORS_FILE, debug=DOOR_DEBUG):
+        if doors_file:
+            with open(doors_file, "r", encoding="utf-8") as f:
+                config = json.load(f)
+            addresses = {door_id: (item["ip"], int(item["port"])) for door_id, item in config.items()}
         else:
-            print(f"Команда отправленная на дверь: {message}")
+            addresses = {}
+            for item in filter(None, (part.strip() for part in doors.split(","))):
+                door_id, address = item.split("=", 1)
+                ip, port = address.rsplit(":", 1)
+                addresses[door_id.strip()] = (ip.strip(), int(port))
+        return cls({door_id: DoorLock(ip, port, debug=debug) for door_id, (ip, port) in addresses.items()})
+
+    def get(self, door_id=None):
+        """Замок двери или None, если дверь не настроена.
+
+        Дверь по умолчанию используется, только если камера не назвала себя
+        или дверь единственная: X-Camera-Id присылает клиент, и опечатка в
+        нём не должна открывать чужую дверь.
+        """
+        if door_id in self.doors:
+            return self.doors[door_id]
+        if not door_id or len(self.doors) == 1:
+            return self.doors.get(self.default_door)
+        return None
+
+    async def open(self, door_id=None, received_at=None) -> bool:
+        """Открывает дверь; received_at — время получения кадра по time.perf_counter()"""
+        door = self.get(door_id)
+        if door is None:
+            logger.error(f"Неизвестная дверь: {door_id}")
+            return False
+        opened = await door.open_door()
+        if opened and received_at is not None:
+            latency = time.perf_counter() - received_at
+            self.unlocks += 1
+            self.unlock_latency_total += latency
+            self.unlock_latency_max = max(self.unlock_latency_max, latency)
+            UNLOCK_LATENCY_SECONDS.observe(latency)
+            logger.info(f"Дверь {door_id or self.default_door} открыта через {latency * 1000:.1f} мс после получения кадра")
+        return opened
+
+    async def close(self):
+        await asyncio.gather(*(door.close() for door in self.doors.values()))
+
+    def stats(self) -> dict:
+        return {
+            "unlocks": self.unlocks,
+            "unlock_latency_avg_ms": self.unlock_latency_total / self.unlocks * 1000 if self.unlocks else 0.0,
+            "unlock_latency_max_ms": self.unlock_latency_max * 1000,
+            "doors": {door_id: door.stats() for door_id, door in self.doors.items()},
+        }
@@ -0,0 +1,66 @@
+"""Локальный имитатор замка для тестов и бенчмарков.
+
+Как и настоящий замок, возвращает полученную команду в качестве
+подтверждения; response задаёт другой ответ, чтобы проверить
+обработку неверного подтверждения. Запуск: python fake_lock.py [порт]
+"""
+import sys
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class FakeLockServer:
+    def __init__(self, host="127.0.0.1", port=0, delay=0.0, response=None):
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.response = response
+        self.commands = []
+        self._server = None
+        self._clients = set()
+
+    async def start(self) -> int:
+        """Запускает сервер и возвращает фактический порт"""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._clients):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        self._clients.add(writer)
+        try:
+            while data := await reader.read(1024):
+                self.commands.append(data.decode('utf-8'))
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                writer.write(data if self.response is None else self.response)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+async def main(port):
+    async with FakeLockServer("0.0.0.0", port) as server:
+        logger.info(f"Имитатор замка слушает порт {server.port}")
+        await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 9091))
@@ -1,30 +1,106 @@
 import os
-import qrcode
-import random
-import string
-import re
+import io
+import hmac
+import base64
+import hashlib
+import secrets
 
-os.makedirs("QRFolder", exist_ok=True)
+from metrics import QR_GENERATION_SECONDS
 
-def generate_random_string(length=12):
-    characters = string.ascii_letters + string.digits + string.punctuation
-    return ''.join(random.choice(characters) for _ in range(length))
+# qrcode и Pillow импортируются при первой генерации, а не при запуске сервера
 
-def sanitize_filename(filename):
-    return re.sub(r'[<>:"/\\|?*]', '_', filename)
+QR_FOLDER = "QRfolder"
 
-def create_qr_code_with_key():
-    random_string = generate_random_string()
-    sanitized_string = sanitize_filename(random_string)
+MEDIA_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+# Ключ — случайные байты в base32 верхнего регистра: такие символы QR-код
+# кодирует в алфавитно-цифровом режиме, и ключ с подписью помещается
+# в версию 1 (до 25 символов при уровне коррекции L)
+KEY_RANDOM_BYTES = 10
+KEY_TAG_BYTES = 5
+# Секрет для HMAC-подписи ключей; без него ключи не подписываются
+QR_SIGNING_KEY = os.environ.get("QR_SIGNING_KEY", "").encode()
+KEY_BODY_LENGTH = (KEY_RANDOM_BYTES * 8 + 4) // 5
+KEY_TAG_LENGTH = (KEY_TAG_BYTES * 8 + 4) // 5
+
+QR_VERSION = 1
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+
+_KEY_ALPHABET = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZ234567")
+
+def _b32(data: bytes) -> str:
+    return base64.b32encode(data).decode("ascii").rstrip("=")
+
+def _key_tag(body: str, signing_key: bytes) -> str:
+    digest = hmac.new(signing_key, body.encode("ascii"), hashlib.sha256).digest()
+    return _b32(digest[:KEY_TAG_BYTES])
+
+def generate_qr_key(signing_key: bytes | None = None) -> str:
+    """Новый одноразовый ключ: 16 символов base32, с подписью — 24"""
+    signing_key = QR_SIGNING_KEY if signing_key is None else signing_key
+    body = _b32(secrets.token_bytes(KEY_RANDOM_BYTES))
+    if signing_key:
+        return body + _key_tag(body, signing_key)
+    return body
+
+def verify_qr_key(qr_key: str, signing_key: bytes | None = None) -> bool:
+    """Проверяет формат и подпись ключа без обращения к базе"""
+    signing_key = QR_SIGNING_KEY if signing_key is None else signing_key
+    length = KEY_BODY_LENGTH + (KEY_TAG_LENGTH if signing_key else 0)
+    if len(qr_key) != length or not _KEY_ALPHABET.issuperset(qr_key):
+        return False
+    if not signing_key:
+        return True
+    return hmac.compare_digest(qr_key[KEY_BODY_LENGTH:], _key_tag(qr_key[:KEY_BODY_LENGTH], signing_key))
+
+def _build_qr(data):
+    import qrcode
     qr = qrcode.QRCode(
-        version=1,
+        version=QR_VERSION,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
+        box_size=QR_BOX_SIZE,
+        border=QR_BORDER,
     )
-    qr.add_data(random_string)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    file_path = f"QRFolder/{sanitized_string}.png"
-    img.save(file_path)
-    return file_path, sanitized_string
+    qr.add_data(data)
+    # Версия фиксирована, подбор размера (fit=True) не нужен
+    qr.make(fit=False)
+    return qr
+
+def render_qr_bytes(data, fmt="png"):
+    """Рендерит QR-код в память и возвращает байты изображения"""
+    with QR_GENERATION_SECONDS.time(fmt=fmt):
+        return _render_qr_bytes(data, fmt)
+
+def _render_qr_bytes(data, fmt):
+    qr = _build_qr(data)
+    buffer = io.BytesIO()
+    if fmt == "svg":
+        import qrcode.image.svg
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+        img.save(buffer)
+    elif fmt == "png":
+        img = qr.make_image(fill_color="black", back_color="white")
+        img.save(buffer, format="PNG")
+    else:
+        raise ValueError(f"Неподдерживаемый формат QR-кода: {fmt}")
+    return buffer.getvalue()
+
+def create_qr_code_in_memory(fmt="png"):
+    """Генерирует ключ и QR-код без записи на диск"""
+    qr_key = generate_qr_key()
+    return render_qr_bytes(qr_key, fmt), qr_key
+
+def create_qr_code_with_key():
+    # Символы base32 допустимы в имени файла, ключ не нужно экранировать
+    qr_key = generate_qr_key()
+    os.makedirs(QR_FOLDER, exist_ok=True)
+    file_path = f"{QR_FOLDER}/{qr_key}.png"
+    with QR_GENERATION_SECONDS.time(fmt="file"):
+        qr = _build_qr(qr_key)
+        img = qr.make_image(fill_color="black", back_color="white")
+        img.save(file_path)
+    return file_path, qr_key
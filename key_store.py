@@ -0,0 +1,56 @@
+import os
+import time
+
+from bd import Database
+from generator import verify_qr_key
+from ttl_cache import TTLCache
+
+KEY_LIFE_TIME = 60
+KEY_CACHE_SIZE = int(os.environ.get("KEY_CACHE_SIZE", "50000"))
+# Сколько секунд помнить отклонённый ключ: камера видит один и тот же
+# QR-код в нескольких кадрах подряд, повторно ходить в базу не нужно
+REJECTED_KEY_TTL = 5
+
+class KeyStore:
+    """Одноразовые QR-ключи: таблица qr_keys плюс LRU/TTL-кэш в памяти процесса"""
+
+    def __init__(self, db: Database, life_time=KEY_LIFE_TIME, cache_size=KEY_CACHE_SIZE):
+        self.db = db
+        self.life_time = life_time
+        self.cache = TTLCache(maxsize=cache_size, ttl=life_time)
+        self.rejected = TTLCache(maxsize=cache_size, ttl=REJECTED_KEY_TTL)
+
+    def issue(self, login: str, qr_key: str):
+        """Привязывает новый ключ к пользователю, старые ключи перестают действовать"""
+        expires_at = time.time() + self.life_time
+        for revoked in self.db.issue_qr_key(login, qr_key, expires_at):
+            self.cache.pop(revoked)
+        self.rejected.pop(qr_key)
+        self.cache.set(qr_key, login)
+
+    def consume(self, qr_key: str):
+        """Погашает ключ. Возвращает логин владельца или None, если ключ недействителен"""
+        # Чужие QR-коды и поддельные ключи отсекаются по формату и подписи без базы
+        if not verify_qr_key(qr_key):
+            return None
+        if qr_key in self.rejected:
+            return None
+        login = self.cache.pop(qr_key)
+        if login is not None:
+            # Ключ известен по кэшу — остаётся удалить строку по первичному ключу
+            if not self.db.delete_qr_key(qr_key, time.time()):
+                login = None
+        else:
+            login = self.db.consume_qr_key(qr_key, time.time())
+        if login is None:
+            self.rejected.set(qr_key, True)
+        return login
+
+    def purge_cache(self):
+        self.cache.purge()
+        self.rejected.purge()
+
+    def sweep(self) -> int:
+        """Удаляет истёкшие ключи из базы, возвращает их количество"""
+        self.purge_cache()
+        return self.db.purge_expired_keys(time.time())
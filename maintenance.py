@@ -0,0 +1,90 @@
+import os
+import time
+import uuid
+import asyncio
+import socket
+import logging
+
+logger = logging.getLogger(__name__)
+
+SWEEP_INTERVAL = 30
+# Аренда живёт три интервала: если воркер-уборщик упал, его место займёт другой
+SWEEPER_LEASE_TTL = SWEEP_INTERVAL * 3
+REVOCATION_SYNC_INTERVAL = 2
+
+class Maintenance:
+    """Фоновые задачи воркера.
+
+    Локальные кэши чистит каждый воркер. Общую уборку (истёкшие ключи,
+    QR-изображения, старые файлы) выполняет только держатель аренды
+    "sweeper", поэтому при нескольких воркерах она не дублируется.
+    """
+
+    def __init__(self, state, key_store, token_cache, folders=()):
+        self.state = state
+        self.key_store = key_store
+        self.token_cache = token_cache
+        # Пары (папка, максимальный возраст файлов в секундах)
+        self.folders = list(folders)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_sweeper = False
+
+    async def sweep_once(self):
+        self.key_store.purge_cache()
+        self.token_cache.purge()
+        self.is_sweeper = await self.state.acquire_lease("sweeper", self.worker_id, SWEEPER_LEASE_TTL)
+        if not self.is_sweeper:
+            return
+        removed = await self.key_store.db.run(self.key_store.sweep)
+        removed += await self.state.purge()
+        for folder, max_age in self.folders:
+            removed += await asyncio.to_thread(sweep_folder, folder, max_age)
+        if removed:
+            logger.info(f"Фоновая уборка удалила записей и файлов: {removed}")
+
+    async def sweep_forever(self, interval=SWEEP_INTERVAL):
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                await self.sweep_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка фоновой уборки: {e}")
+
+    async def sync_revocations_forever(self, interval=REVOCATION_SYNC_INTERVAL):
+        """Переносит отзывы токенов, сделанные другими воркерами, в локальный кэш"""
+        since = 0.0
+        while True:
+            try:
+                # Перекрытие окна на случай записей, закоммиченных с опозданием
+                rows = await self.state.revoked_tokens_since(since - interval)
+                for token_hash, expires_at, revoked_at in rows:
+                    self.token_cache.revoke(token_hash, expires_at)
+                    since = max(since, revoked_at)
+                await asyncio.sleep(interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка синхронизации отозванных токенов: {e}")
+                await asyncio.sleep(interval)
+
+def sweep_folder(folder: str, max_age: float) -> int:
+    """Удаляет из папки изображения старше max_age секунд"""
+    if not os.path.isdir(folder):
+        return 0
+    removed = 0
+    deadline = time.time() - max_age
+    for name in os.listdir(folder):
+        if not name.lower().endswith(('.png', '.jpg', '.jpeg')):
+            continue
+        path = os.path.join(folder, name)
+        try:
+            if os.path.getmtime(path) <= deadline:
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Ошибка при удалении {path}: {e}")
+    return removed
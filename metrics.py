@@ -0,0 +1,167 @@
+"""Метрики в текстовом формате Prometheus.
+
+Метрики живут в памяти процесса: при нескольких воркерах каждый отдаёт
+на /metrics свои значения, а суммирует их сам Prometheus.
+"""
+import os
+import time
+import bisect
+import random
+import cProfile
+import threading
+from contextlib import contextmanager
+
+# Доля запросов, которые профилируются cProfile; 0 — профилирование выключено
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Имя -> метрика; повторная регистрация с тем же именем заменяет прежнюю
+_metrics = {}
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics[name] = self
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+class Gauge:
+    """Значение считывается функцией в момент запроса /metrics.
+
+    kind="counter" — для счётчиков, которые уже ведутся в другом объекте.
+    """
+
+    def __init__(self, name, documentation, func, kind="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        self.kind = kind
+        _metrics[name] = self
+
+    def render(self):
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            f"{self.name} {_format_value(self.func())}",
+        ]
+
+class Histogram:
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        # labels -> [счётчики по корзинам..., сумма, количество]
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics[name] = self
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, data in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, data):
+                    cumulative += count
+                    labels = _format_labels(key + (("le", _format_value(bound)),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {data[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(data[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {data[-1]}")
+        return lines
+
+def render_metrics() -> str:
+    lines = []
+    for metric in list(_metrics.values()):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# --- Выборочное профилирование ---
+_profiling = threading.Lock()
+
+def start_profile():
+    """С вероятностью PROFILE_SAMPLE_RATE запускает cProfile; иначе возвращает None.
+
+    Профилируется весь поток event loop, то есть и соседние корутины:
+    это срез того, чем был занят процесс во время запроса.
+    """
+    if not PROFILE_SAMPLE_RATE or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    # Одновременно может работать только один профилировщик
+    if not _profiling.acquire(blocking=False):
+        return None
+    profile = cProfile.Profile()
+    profile.enable()
+    return profile
+
+def stop_profile(profile, name):
+    """Останавливает профилировщик и сохраняет результат в PROFILE_DIR"""
+    try:
+        profile.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        safe_name = "".join(c if c.isalnum() else "_" for c in name).strip("_") or "root"
+        profile.dump_stats(os.path.join(PROFILE_DIR, f"{time.time():.3f}-{safe_name}.prof"))
+    finally:
+        _profiling.release()
+
+# --- Метрики горячего пути ---
+HTTP_REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Время обработки HTTP-запроса")
+QR_GENERATION_SECONDS = Histogram("qr_generation_seconds", "Время генерации QR-кода")
+QR_DECODE_SECONDS = Histogram("qr_decode_seconds", "Время распознавания кадра в пуле, включая ожидание")
+DB_QUERY_SECONDS = Histogram("db_query_seconds", "Время операции с базой данных")
+DOOR_ACK_SECONDS = Histogram("door_ack_seconds", "Время от отправки команды замку до подтверждения")
+UNLOCK_LATENCY_SECONDS = Histogram("unlock_latency_seconds", "Время от получения кадра до подтверждения открытия двери")
+ACCESS_GRANTED = Counter("access_granted_total", "Кадры, по которым дверь открыта")
+ACCESS_DENIED = Counter("access_denied_total", "Кадры с недействительным ключом или неоткрывшейся дверью")
+FRAMES_WITHOUT_QR = Counter("frames_without_qr_total", "Кадры без распознанного QR-кода")
+FRAMES_WITH_USED_KEY = Counter("frames_with_used_key_total", "Кадры с ключом, по которому дверь только что открыта")
+FRAMES_DROPPED = Counter("frames_dropped_total", "Кадры, отброшенные без распознавания")
+DECODE_POOL_RESTARTS = Counter("decode_pool_restarts_total", "Пересоздания пула распознавания после падения процесса")
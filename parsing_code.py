@@ -1,17 +1,154 @@
+"""Массовый импорт пользователей из JSON, JSONL или CSV.
+
+Файл читается потоково и записывается пачками, так что память не растёт
+с размером файла. Пароли, если они есть, хешируются параллельно.
+
+Пример: python parsing_code.py staff.jsonl --db users.db --chunk-size 1000
+"""
+import os
+import re
+import csv
 import json
-from bd import Database  # Импорт вашего класса Database
+import time
+import logging
+import argparse
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+
+from bd import Database
+from passwords import hash_password, BCRYPT_ROUNDS, PASSWORD_WORKERS
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+READ_SIZE = 64 * 1024
+_NUMBER_TAIL = re.compile(r"[0-9.eE+-]*")
+
+def iter_json_array(f, read_size=READ_SIZE):
+    """Поэлементно отдаёт элементы JSON-массива верхнего уровня, не читая файл целиком"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+    # open -> first -> (separator -> value)*: что ожидается следующим
+    expect = "open"
+    while True:
+        buffer = buffer.lstrip()
+        if buffer:
+            char = buffer[0]
+            if expect == "open":
+                if char != "[":
+                    raise ValueError("Ожидался JSON-массив")
+                buffer = buffer[1:]
+                expect = "first"
+                continue
+            if expect == "separator":
+                if char == "]":
+                    return
+                if char != ",":
+                    raise ValueError("Ожидалась запятая или конец JSON-массива")
+                buffer = buffer[1:]
+                expect = "value"
+                continue
+            if char == "]" and expect == "first":
+                return
+            if char in ",]":
+                raise ValueError("Ожидался элемент JSON-массива")
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # Элемент ещё не дочитан целиком
+                if eof:
+                    raise
+            else:
+                # Число на границе прочитанного куска могло быть обрезано
+                # ("4.5e" из "4.5e10") — тогда сначала дочитываем
+                if eof or not _NUMBER_TAIL.fullmatch(buffer, end):
+                    yield item
+                    buffer = buffer[end:]
+                    expect = "separator"
+                    continue
+        if eof:
+            raise ValueError("Неожиданный конец JSON-массива")
+        chunk = f.read(read_size)
+        eof = not chunk
+        buffer += chunk
+
+def iter_jsonl(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def iter_records(path, fmt=None):
+    """Отдаёт записи файла в зависимости от формата (по умолчанию — по расширению)"""
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if fmt == "json":
+            yield from iter_json_array(f)
+        elif fmt in ("jsonl", "ndjson"):
+            yield from iter_jsonl(f)
+        elif fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            raise ValueError(f"Неизвестный формат файла: {fmt}")
+
+def _prepare(entry, rounds):
+    if not isinstance(entry, dict):
+        return None
+    # Логины и пароли могут быть числами (табельные номера)
+    login = entry.get("login")
+    login = str(login).strip() if login is not None else ""
+    if not login:
+        return None
+    password = entry.get("password")
+    password = str(password) if password is not None else ""
+    return login, hash_password(password, rounds) if password else None
+
+def import_users(path, db: Database, fmt=None, chunk_size=CHUNK_SIZE, workers=PASSWORD_WORKERS, rounds=BCRYPT_ROUNDS):
+    """Импортирует пользователей с upsert по login и возвращает статистику"""
+    started = time.perf_counter()
+    imported = skipped = 0
+    records = iter_records(path, fmt)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            prepared = list(executor.map(_prepare, chunk, [rounds] * len(chunk)))
+            users = [user for user in prepared if user is not None]
+            skipped += len(prepared) - len(users)
+            imported += db.bulk_upsert_users(users)
+            logger.info(f"Импортировано {imported} пользователей")
+    elapsed = time.perf_counter() - started
+    return {
+        "imported": imported,
+        "skipped": skipped,
+        "seconds": elapsed,
+        "rows_per_second": imported / elapsed if elapsed else 0.0,
+    }
 
 def json_to_sqlite(json_path: str, db: Database):
-    with open(json_path, 'r') as f:
-        data = json.load(f)
-    
-    for entry in data:
-        db.import_user_data(
-            lastname=entry['lastname'],
-            initials=entry['initials']
-        )
+    return import_users(json_path, db, fmt="json")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="файл JSON, JSONL или CSV с полями login и password")
+    parser.add_argument("--db", default="users.db", help="файл базы данных")
+    parser.add_argument("--format", choices=("json", "jsonl", "csv"), help="формат файла, если не ясен по расширению")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="записей в одной транзакции")
+    parser.add_argument("--workers", type=int, default=PASSWORD_WORKERS, help="потоков для хеширования паролей")
+    parser.add_argument("--rounds", type=int, default=BCRYPT_ROUNDS, help="стоимость bcrypt")
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    try:
+        result = import_users(args.path, db, args.format, args.chunk_size, args.workers, args.rounds)
+    finally:
+        db.close()
+    print(f"Импортировано: {result['imported']}, пропущено: {result['skipped']}, "
+          f"за {result['seconds']:.2f} с ({result['rows_per_second']:.0f} записей/с)")
 
 # Использование
 if __name__ == "__main__":
-    db = Database('my_database.db')
-    json_to_sqlite('input.json', db)
+    logging.basicConfig(level=logging.INFO)
+    main()
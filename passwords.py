@@ -0,0 +1,59 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+
+# Стоимость bcrypt (log2 числа раундов)
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+# bcrypt отпускает GIL, поэтому хватает пула потоков
+PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Сколько операций может ждать в очереди, прежде чем запросы начнут отклоняться
+PASSWORD_QUEUE_LIMIT = int(os.environ.get("PASSWORD_QUEUE_LIMIT", "64"))
+
+# Заглушка для пользователей, импортированных без пароля: bcrypt её не примет,
+# поэтому войти по такому пользователю нельзя
+UNUSABLE_PASSWORD = "!"
+
+class PasswordPoolBusy(Exception):
+    """Очередь на хеширование паролей переполнена"""
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+def verify_password(plain_password: str, hashed_password) -> bool:
+    if isinstance(hashed_password, str):
+        hashed_password = hashed_password.encode('utf-8')
+    try:
+        return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password)
+    except ValueError:
+        # Некорректный или пустой хеш — например, у пользователя без пароля
+        return False
+
+class PasswordHasher:
+    """Выполняет bcrypt в отдельном пуле потоков, не блокируя event loop"""
+
+    def __init__(self, workers=PASSWORD_WORKERS, queue_limit=PASSWORD_QUEUE_LIMIT, rounds=BCRYPT_ROUNDS):
+        self.rounds = rounds
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+
+    async def _run(self, func, *args):
+        if self._pending >= self.queue_limit:
+            raise PasswordPoolBusy()
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password, self.rounds)
+
+    async def verify(self, plain_password: str, hashed_password) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,92 @@
+"""Декодирование QR-кодов на кадрах.
+
+Модуль намеренно лёгкий: он импортируется в процессах пула декодирования
+и не должен тянуть за собой базу данных или веб-сервер.
+
+Кадр переводится в оттенки серого и проверяется по стратегиям от дешёвой
+к дорогой: сначала область, где код нашёлся на прошлом кадре этой камеры,
+затем уменьшенная копия кадра и только потом полное разрешение.
+"""
+import io
+import os
+import numpy as np
+from PIL import Image
+from pyzbar.pyzbar import decode, ZBarSymbol
+
+# Наибольшая сторона уменьшенной копии кадра
+DOWNSCALE_MAX_SIDE = int(os.environ.get("DOWNSCALE_MAX_SIDE", "640"))
+# Запас вокруг прошлой области кода, в долях её размера
+ROI_MARGIN = 0.5
+
+STRATEGIES = ("roi", "downscale", "full")
+
+def open_image(source):
+    """Открывает изображение по пути к файлу или из байтов"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(source))
+    return Image.open(source)
+
+def to_gray(img):
+    """PIL-изображение -> двумерный массив uint8"""
+    if img.mode != "L":
+        img = img.convert("L")
+    return np.asarray(img, dtype=np.uint8)
+
+def _decode_gray(gray):
+    """Возвращает (текст, (left, top, width, height)) или None"""
+    decoded_objects = decode(gray, symbols=[ZBarSymbol.QRCODE])
+    if not decoded_objects:
+        return None
+    symbol = decoded_objects[0]
+    return symbol.data.decode("utf-8"), tuple(symbol.rect)
+
+def _try_roi(gray, roi):
+    height, width = gray.shape
+    left, top, box_width, box_height = roi
+    margin_x = int(box_width * ROI_MARGIN)
+    margin_y = int(box_height * ROI_MARGIN)
+    x0, y0 = max(0, left - margin_x), max(0, top - margin_y)
+    x1, y1 = min(width, left + box_width + margin_x), min(height, top + box_height + margin_y)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    found = _decode_gray(gray[y0:y1, x0:x1])
+    if found is None:
+        return None
+    text, (l, t, w, h) = found
+    return text, (l + x0, t + y0, w, h)
+
+def _try_downscale(gray, max_side=DOWNSCALE_MAX_SIDE):
+    factor = -(-max(gray.shape) // max_side)
+    if factor <= 1:
+        return None
+    small = to_gray(Image.fromarray(gray).reduce(factor))
+    found = _decode_gray(small)
+    if found is None:
+        return None
+    text, (l, t, w, h) = found
+    return text, (l * factor, t * factor, w * factor, h * factor)
+
+def detect_qr(img, roi=None, strategies=STRATEGIES):
+    """Ищет QR-код по стратегиям из ``strategies``.
+
+    Возвращает (текст, область, стратегия) или (None, None, None).
+    """
+    gray = to_gray(img)
+    for strategy in strategies:
+        if strategy == "roi":
+            found = _try_roi(gray, roi) if roi else None
+        elif strategy == "downscale":
+            found = _try_downscale(gray)
+        else:
+            found = _decode_gray(gray)
+        if found is not None:
+            return found[0], found[1], strategy
+    return None, None, None
+
+def decode_image(img):
+    """Возвращает текст первого найденного QR-кода или None"""
+    return detect_qr(img)[0]
+
+def decode_frame(frame, roi=None):
+    """Точка входа для пула процессов: байты кадра -> (текст, область, стратегия)"""
+    return detect_qr(open_image(frame), roi)
@@ -0,0 +1,85 @@
+import os
+import asyncio
+import logging
+from collections import deque
+
+from generator import create_qr_code_in_memory
+
+logger = logging.getLogger(__name__)
+
+QR_POOL_SIZE = int(os.environ.get("QR_POOL_SIZE", "256"))
+# Пул начинает пополняться, когда в нём остаётся меньше QR_POOL_LOW_WATERMARK кодов
+QR_POOL_LOW_WATERMARK = int(os.environ.get("QR_POOL_LOW_WATERMARK", "64"))
+QR_POOL_BATCH = 16
+
+class QRKeyPool:
+    """Запас заранее сгенерированных пар (PNG, ключ) для /show.
+
+    Ключи из пула ещё ни к кому не привязаны: привязка происходит при выдаче.
+    Пополнение идёт в рабочем потоке, чтобы не занимать event loop.
+    """
+
+    def __init__(self, render=create_qr_code_in_memory, size=QR_POOL_SIZE, low_watermark=QR_POOL_LOW_WATERMARK):
+        self.render = render
+        self.size = size
+        self.low_watermark = low_watermark
+        self._items = deque()
+        self._refill = None
+        self._task = None
+        self.served = 0
+        self.empty_events = 0
+
+    def _wake(self):
+        if self._refill is not None:
+            self._refill.set()
+
+    def start(self):
+        """Запускает пополнение пула, если оно ещё не запущено"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def get(self):
+        """Возвращает (байты PNG, ключ); при пустом пуле генерирует код на месте"""
+        self.start()
+        if len(self._items) <= self.low_watermark:
+            self._wake()
+        try:
+            item = self._items.popleft()
+        except IndexError:
+            self.empty_events += 1
+            logger.warning("Пул QR-кодов пуст, код генерируется по запросу")
+            return await asyncio.to_thread(self.render)
+        self.served += 1
+        return item
+
+    def _render_batch(self, count):
+        return [self.render() for _ in range(count)]
+
+    async def run(self):
+        """Фоновая задача пополнения пула"""
+        self._refill = asyncio.Event()
+        self._refill.set()
+        while True:
+            await self._refill.wait()
+            self._refill.clear()
+            try:
+                while len(self._items) < self.size:
+                    count = min(QR_POOL_BATCH, self.size - len(self._items))
+                    self._items.extend(await asyncio.to_thread(self._render_batch, count))
+            except Exception as e:
+                logger.error(f"Ошибка при пополнении пула QR-кодов: {e}")
+                await asyncio.sleep(1)
+                self._refill.set()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._items),
+            "capacity": self.size,
+            "served": self.served,
+            "empty_events": self.empty_events,
+        }
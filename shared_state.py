@@ -0,0 +1,78 @@
+"""Состояние, общее для всех воркеров сервера.
+
+При одном воркере достаточно памяти процесса (backend ``memory``). При
+нескольких воркерах uvicorn/gunicorn QR-изображения, отозванные токены и
+аренда фоновых задач хранятся в SQLite (backend ``sqlite``), чтобы любой
+воркер мог ответить на любой запрос.
+
+Число воркеров берётся из WEB_CONCURRENCY — эту же переменную gunicorn
+использует по умолчанию для -w, поэтому запускать нужно так:
+``WEB_CONCURRENCY=4 gunicorn -k uvicorn.workers.UvicornWorker app:app``.
+С ``gunicorn -w 4`` без WEB_CONCURRENCY каждый воркер считает себя
+единственным; в этом случае задайте SHARED_STATE_BACKEND=sqlite явно.
+"""
+import os
+import time
+
+from bd import Database
+from ttl_cache import TTLCache
+
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+SHARED_STATE_BACKEND = os.environ.get("SHARED_STATE_BACKEND", "sqlite" if WEB_CONCURRENCY > 1 else "memory")
+IMAGE_STORE_SIZE = int(os.environ.get("QR_STORE_SIZE", "10000"))
+
+class MemoryState:
+    """Состояние в памяти процесса — только для одного воркера"""
+
+    def __init__(self, image_store_size=IMAGE_STORE_SIZE):
+        self._images = TTLCache(maxsize=image_store_size)
+
+    async def put_image(self, qr_id: str, content: bytes, media_type: str, ttl: float):
+        self._images.set(qr_id, (content, media_type), ttl=ttl)
+
+    async def get_image(self, qr_id: str):
+        return self._images.get(qr_id)
+
+    async def revoke_token(self, token_hash: str, expires_at: float):
+        # Локальный TokenCache уже знает об отзыве, делиться не с кем
+        pass
+
+    async def revoked_tokens_since(self, since: float) -> list:
+        return []
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        return True
+
+    async def purge(self) -> int:
+        return self._images.purge()
+
+class SQLiteState:
+    """Состояние в общей базе SQLite для нескольких воркеров"""
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    async def put_image(self, qr_id: str, content: bytes, media_type: str, ttl: float):
+        await self.db.run(self.db.put_qr_image, qr_id, content, media_type, time.time() + ttl)
+
+    async def get_image(self, qr_id: str):
+        return await self.db.run(self.db.get_qr_image, qr_id, time.time())
+
+    async def revoke_token(self, token_hash: str, expires_at: float):
+        await self.db.run(self.db.revoke_token, token_hash, expires_at, time.time())
+
+    async def revoked_tokens_since(self, since: float) -> list:
+        return await self.db.run(self.db.revoked_tokens_since, since)
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        return await self.db.run(self.db.acquire_lease, name, owner, time.time(), ttl)
+
+    async def purge(self) -> int:
+        return await self.db.run(self.db.purge_shared_state, time.time())
+
+def create_shared_state(db: Database, backend=SHARED_STATE_BACKEND):
+    if backend == "sqlite":
+        return SQLiteState(db)
+    if backend == "memory":
+        return MemoryState()
+    raise ValueError(f"Неизвестный backend общего состояния: {backend}")
@@ -0,0 +1,101 @@
+import time
+import asyncio
+
+import pytest
+
+from decode_pool import DecodePool, CameraBusy, DecodePoolSaturated
+
+
+def slow_decode(frame, roi):
+    # Выполняется в процессе пула, поэтому объявлена на уровне модуля
+    time.sleep(0.3)
+    return frame.decode(), None, None
+
+
+async def drain(*tasks):
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def test_identical_frames_share_processing():
+    calls = []
+
+    async def handler(text):
+        calls.append(text)
+        await asyncio.sleep(0.05)
+        return {"access_granted": True, "key": text}
+
+    async def scenario():
+        pool = DecodePool(decode_func=slow_decode, workers=1)
+        try:
+            first = pool.submit(b"KEY", "camera-1", handler)
+            second = pool.submit(b"KEY", "camera-1", handler)
+            results = await asyncio.gather(first, second)
+        finally:
+            pool.close()
+        return first is second, results, pool.stats()
+
+    same_task, results, stats = asyncio.run(scenario())
+    assert same_task
+    assert calls == ["KEY"]
+    assert results == [{"access_granted": True, "key": "KEY"}] * 2
+    assert stats["coalesced"] == 1
+    assert stats["submitted"] == 1
+
+
+def test_camera_busy():
+    async def scenario():
+        pool = DecodePool(decode_func=slow_decode, workers=1, queue_limit=10, per_camera_limit=1)
+        try:
+            first = pool.submit(b"A", "camera-1")
+            with pytest.raises(CameraBusy):
+                pool.submit(b"B", "camera-1")
+            other = pool.submit(b"C", "camera-2")
+            await drain(first, other)
+            # Кадр обработан — камера снова может присылать новые
+            assert await pool.submit(b"D", "camera-1") == "D"
+        finally:
+            pool.close()
+        return pool.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["dropped"] == 1
+
+
+def test_pool_saturated():
+    async def scenario():
+        pool = DecodePool(decode_func=slow_decode, workers=1, queue_limit=1, per_camera_limit=2)
+        try:
+            first = pool.submit(b"A", "camera-1")
+            with pytest.raises(DecodePoolSaturated):
+                pool.submit(b"B", "camera-2")
+            # Дубликат кадра в работе не занимает место в очереди
+            assert pool.submit(b"A", "camera-1") is first
+            await drain(first)
+        finally:
+            pool.close()
+        return pool.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["dropped"] == 1
+    assert stats["coalesced"] == 1
+
+
+def decode_with_bbox(frame, roi):
+    return frame.decode(), (0, 0, 10, 10), "full"
+
+
+def test_roi_cache_is_bounded():
+    async def scenario():
+        pool = DecodePool(decode_func=decode_with_bbox, workers=1)
+        pool._roi.maxsize = 3
+        try:
+            for i in range(10):
+                await pool.submit(f"K{i}".encode(), f"camera-{i}")
+        finally:
+            pool.close()
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert len(pool._roi) == 3
+    assert pool._roi.get("camera-9") == (0, 0, 10, 10)
+    assert pool._roi.get("camera-0") is None
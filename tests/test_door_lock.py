@@ -0,0 +1,143 @@
+import time
+import socket
+import asyncio
+
+import door_lock
+from door_lock import DoorLock, DoorRegistry
+from fake_lock import FakeLockServer
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_open_door_acknowledged():
+    async def scenario():
+        async with FakeLockServer() as server:
+            lock = DoorLock("127.0.0.1", server.port, timeout=1.0)
+            assert await lock.open_door()
+            assert await lock.open_door()
+            await lock.close()
+        return server.commands, lock.stats()
+
+    commands, stats = asyncio.run(scenario())
+    assert commands == ["open", "open"]
+    assert stats["commands"] == 2
+    assert stats["errors"] == 0
+
+
+def test_reconnects_after_lock_closed_connection():
+    async def scenario():
+        server = FakeLockServer()
+        port = await server.start()
+        lock = DoorLock("127.0.0.1", port, timeout=1.0)
+        assert await lock.open_door()
+        # Замок перезагрузился: постоянное соединение закрыто с его стороны
+        await server.stop()
+        restarted = FakeLockServer(port=port)
+        await restarted.start()
+        try:
+            opened = await lock.open_door()
+        finally:
+            await lock.close()
+            await restarted.stop()
+        return opened, restarted.commands, lock.stats()
+
+    opened, commands, stats = asyncio.run(scenario())
+    assert opened
+    assert commands == ["open"]
+    assert stats["errors"] == 0
+
+
+def test_backoff_after_failed_connect(monkeypatch):
+    monkeypatch.setattr(door_lock, "DOOR_RECONNECT_MIN_DELAY", 0.2)
+
+    async def scenario():
+        lock = DoorLock("127.0.0.1", free_port(), timeout=1.0)
+        assert not await lock.open_door()
+        assert not lock.available()
+        # Во время задержки подключение даже не пытаются открыть
+        started = time.monotonic()
+        assert not await lock.open_door()
+        assert time.monotonic() - started < 0.1
+        assert lock._failures == 1
+        await asyncio.sleep(0.25)
+        assert lock.available()
+        assert not await lock.open_door()
+        # Вторая неудача подряд удваивает задержку
+        assert lock._failures == 2
+        assert lock._next_attempt - time.monotonic() > 0.2
+        return lock.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["errors"] == 3
+
+
+def test_timeout_does_not_resend_command():
+    async def scenario():
+        async with FakeLockServer() as server:
+            lock = DoorLock("127.0.0.1", server.port, timeout=0.3)
+            assert await lock.open_door()
+            # Замок завис на уже открытом соединении: команда дошла, ответа нет
+            server.delay = 1.0
+            started = time.perf_counter()
+            opened = await lock.open_door()
+            elapsed = time.perf_counter() - started
+            await asyncio.sleep(0.1)
+            await lock.close()
+        return opened, elapsed, server.commands
+
+    opened, elapsed, commands = asyncio.run(scenario())
+    assert not opened
+    assert elapsed < 0.5
+    assert commands == ["open", "open"]
+
+
+def test_ack_mismatch():
+    async def scenario():
+        async with FakeLockServer(response=b"nope") as server:
+            lock = DoorLock("127.0.0.1", server.port, timeout=1.0)
+            opened = await lock.open_door()
+            connected = lock._writer is not None
+            await lock.close()
+        return opened, connected, lock.stats()
+
+    opened, connected, stats = asyncio.run(scenario())
+    assert not opened
+    assert not connected
+    assert stats["errors"] == 1
+
+
+def test_registry_falls_back_to_default_door():
+    registry = DoorRegistry.from_config("main=127.0.0.1:9091", doors_file=None, debug=True)
+    assert registry.get("camera-7") is registry.doors["main"]
+    assert registry.get(None) is registry.doors["main"]
+    assert asyncio.run(registry.open("camera-7"))
+
+
+def test_registry_does_not_guess_door_among_several():
+    registry = DoorRegistry.from_config("main=127.0.0.1:9091,side=127.0.0.1:9092", doors_file=None, debug=True)
+    assert registry.get("side") is registry.doors["side"]
+    assert registry.get(None) is registry.doors["main"]
+    assert registry.get("sdie") is None
+    assert not asyncio.run(registry.open("sdie"))
+
+
+def test_ready_connects_before_command():
+    async def scenario():
+        async with FakeLockServer() as server:
+            lock = DoorLock("127.0.0.1", server.port, timeout=1.0)
+            assert await lock.ready()
+            connected = lock._writer is not None
+            assert await lock.open_door()
+            await lock.close()
+        down = DoorLock("127.0.0.1", free_port(), timeout=1.0)
+        return connected, server.commands, await down.ready(), down.available()
+
+    connected, commands, down_ready, down_available = asyncio.run(scenario())
+    assert connected
+    assert commands == ["open"]
+    assert not down_ready
+    assert not down_available
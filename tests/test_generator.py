@@ -0,0 +1,53 @@
+import pytest
+
+from generator import generate_qr_key, verify_qr_key, KEY_BODY_LENGTH, KEY_TAG_LENGTH
+
+SECRET = b"test-signing-key"
+ALPHABET = set("ABCDEFGHIJKLMNOPQRSTUVWXYZ234567")
+
+
+def test_unsigned_key_format():
+    key = generate_qr_key(b"")
+    assert len(key) == KEY_BODY_LENGTH == 16
+    assert set(key) <= ALPHABET
+    assert verify_qr_key(key, b"")
+
+
+def test_signed_key_format():
+    key = generate_qr_key(SECRET)
+    assert len(key) == KEY_BODY_LENGTH + KEY_TAG_LENGTH == 24
+    assert set(key) <= ALPHABET
+    assert verify_qr_key(key, SECRET)
+
+
+def test_keys_are_random():
+    assert len({generate_qr_key(b"") for _ in range(1000)}) == 1000
+
+
+@pytest.mark.parametrize("key", ["", "A" * 15, "A" * 17, "a" * 16, "A" * 15 + "1", "A" * 15 + "/", "A" * 24])
+def test_malformed_unsigned_keys_rejected(key):
+    assert not verify_qr_key(key, b"")
+
+
+def test_tampered_tag_rejected():
+    key = generate_qr_key(SECRET)
+    last = "B" if key[-1] == "A" else "A"
+    assert not verify_qr_key(key[:-1] + last, SECRET)
+    body = "A" if key[0] != "A" else "B"
+    assert not verify_qr_key(body + key[1:], SECRET)
+
+
+def test_signature_depends_on_secret():
+    key = generate_qr_key(SECRET)
+    assert not verify_qr_key(key, b"other-secret")
+    # Ключ без подписи не проходит, когда подпись обязательна
+    assert not verify_qr_key(generate_qr_key(b""), SECRET)
+
+
+def test_signed_key_fits_qr_version_1():
+    pytest.importorskip("qrcode")
+    from generator import _build_qr, QR_VERSION
+    qr = _build_qr(generate_qr_key(SECRET))
+    assert QR_VERSION == 1
+    assert qr.version == 1
+    assert qr.modules_count == 21
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+pytest.importorskip("bcrypt")
+
+from bd import Database
+from key_store import KeyStore
+from generator import generate_qr_key
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "users.db"))
+    yield database
+    database.close()
+
+
+def test_key_is_single_use(db):
+    store = KeyStore(db)
+    key = generate_qr_key()
+    store.issue("alice", key)
+    assert store.consume(key) == "alice"
+    assert store.consume(key) is None
+
+
+def test_key_is_single_use_without_cache(db):
+    # Другой воркер: ключа нет в его кэше, погашение идёт через базу
+    key = generate_qr_key()
+    KeyStore(db).issue("alice", key)
+    other = KeyStore(db)
+    assert other.consume(key) == "alice"
+    assert KeyStore(db).consume(key) is None
+
+
+def test_expired_key_is_rejected(db):
+    store = KeyStore(db, life_time=0.05)
+    key = generate_qr_key()
+    store.issue("alice", key)
+    time.sleep(0.1)
+    assert store.consume(key) is None
+    assert KeyStore(db).consume(key) is None
+    assert db.purge_expired_keys(time.time()) == 1
+
+
+def test_reissue_revokes_previous_key(db):
+    store = KeyStore(db)
+    old, new = generate_qr_key(), generate_qr_key()
+    store.issue("alice", old)
+    store.issue("alice", new)
+    assert store.consume(old) is None
+    assert KeyStore(db).consume(old) is None
+    assert store.consume(new) == "alice"
+
+
+def test_issue_clears_rejected_cache(db):
+    store = KeyStore(db)
+    key = generate_qr_key()
+    assert store.consume(key) is None
+    assert key in store.rejected
+    store.issue("alice", key)
+    assert store.consume(key) == "alice"
+
+
+def test_malformed_key_is_rejected_without_db(db):
+    store = KeyStore(db)
+    store.issue("alice", "not-a-key")
+    assert store.consume("not-a-key") is None
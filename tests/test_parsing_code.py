@@ -0,0 +1,44 @@
+import io
+
+import pytest
+
+pytest.importorskip("bcrypt")
+
+from parsing_code import iter_json_array, _prepare
+from passwords import verify_password
+
+
+def parse(text, read_size=3):
+    return list(iter_json_array(io.StringIO(text), read_size=read_size))
+
+
+@pytest.mark.parametrize("read_size", [1, 2, 3, 5, 64 * 1024])
+def test_json_array_chunk_boundaries(read_size):
+    text = '[ 123 , 4.5e10 ,"x", -0.25E-3, {"login": "a, ]"}, [1, 2], true, null ]'
+    assert parse(text, read_size) == [123, 4.5e10, "x", -0.25e-3, {"login": "a, ]"}, [1, 2], True, None]
+
+
+@pytest.mark.parametrize("text", ["[]", " [ ] ", "\n[\n]\n"])
+def test_json_array_empty(text):
+    assert parse(text) == []
+
+
+@pytest.mark.parametrize("text", ["[1 2]", "[1,,2]", "[,1]", "[1,]", "[1", "[1,", "{}", "", "[1.2.3]"])
+def test_json_array_malformed(text):
+    with pytest.raises(ValueError):
+        parse(text)
+
+
+def test_prepare_coerces_numbers():
+    login, hashed = _prepare({"login": 1042, "password": 777}, rounds=4)
+    assert login == "1042"
+    assert verify_password("777", hashed)
+
+
+@pytest.mark.parametrize("entry", [{"login": None}, {"login": "  "}, {"password": "x"}, [1, 2], 5])
+def test_prepare_skips_rows_without_login(entry):
+    assert _prepare(entry, rounds=4) is None
+
+
+def test_prepare_keeps_password_when_missing():
+    assert _prepare({"login": "a"}, rounds=4) == ("a", None)
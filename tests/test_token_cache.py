@@ -0,0 +1,34 @@
+import time
+
+from token_cache import TokenCache
+
+
+def test_revoked_tokens_are_not_evicted_by_size():
+    cache = TokenCache(maxsize=10, default_ttl=60)
+    expires_at = time.time() + 60
+    hashes = [cache.token_hash(f"token-{i}") for i in range(100)]
+    for token_hash in hashes:
+        cache.revoke(token_hash, expires_at)
+    assert all(cache.is_revoked(token_hash) for token_hash in hashes)
+    assert cache.stats()["revoked"] == 100
+
+
+def test_revoked_token_is_not_served_from_cache():
+    cache = TokenCache(maxsize=10, default_ttl=60)
+    token_hash = cache.token_hash("token")
+    cache.put(token_hash, "user", time.time() + 60)
+    assert cache.get(token_hash) == "user"
+    cache.revoke(token_hash, cache.get_expiry(token_hash))
+    assert cache.get(token_hash) is None
+
+
+def test_purge_drops_only_expired_revocations():
+    cache = TokenCache(maxsize=10, default_ttl=60)
+    expired, active = cache.token_hash("old"), cache.token_hash("new")
+    cache.revoke(expired, time.time() + 0.05)
+    cache.revoke(active, time.time() + 60)
+    time.sleep(0.1)
+    assert not cache.is_revoked(expired)
+    cache.purge()
+    assert cache.stats()["revoked"] == 1
+    assert cache.is_revoked(active)
@@ -0,0 +1,80 @@
+import time
+import hashlib
+import threading
+
+from ttl_cache import TTLCache
+
+class TokenCache:
+    """Кэш проверенных JWT с ключом по хешу токена и список отозванных токенов.
+
+    Запись живёт не дольше, чем действует сам токен (claim ``exp``).
+    Отозванные токены по размеру не вытесняются: иначе после множества
+    выходов старый отозванный токен снова стал бы действительным. Они
+    хранятся до истечения срока и удаляются в purge().
+    """
+
+    def __init__(self, maxsize=10000, default_ttl=1800):
+        self.default_ttl = default_ttl
+        self._tokens = TTLCache(maxsize=maxsize, ttl=default_ttl)
+        # token_hash -> момент истечения по time.time()
+        self._denylist = {}
+        self._denylist_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def token_hash(token: str) -> str:
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def _ttl(self, expires_at):
+        if expires_at is None:
+            return self.default_ttl
+        return expires_at - time.time()
+
+    def get(self, token_hash: str):
+        """Возвращает закэшированного пользователя или None"""
+        if self.is_revoked(token_hash):
+            return None
+        item = self._tokens.get(token_hash)
+        if item is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return item[0]
+
+    def get_expiry(self, token_hash: str):
+        item = self._tokens.get(token_hash)
+        return item[1] if item is not None else None
+
+    def put(self, token_hash: str, user, expires_at=None):
+        ttl = self._ttl(expires_at)
+        if ttl > 0:
+            self._tokens.set(token_hash, (user, expires_at), ttl=ttl)
+
+    def revoke(self, token_hash: str, expires_at=None):
+        """Добавляет токен в список отозванных до истечения его срока"""
+        self._tokens.pop(token_hash)
+        ttl = self._ttl(expires_at)
+        if ttl > 0:
+            with self._denylist_lock:
+                self._denylist[token_hash] = time.time() + ttl
+
+    def is_revoked(self, token_hash: str) -> bool:
+        expires_at = self._denylist.get(token_hash)
+        return expires_at is not None and expires_at > time.time()
+
+    def purge(self):
+        self._tokens.purge()
+        now = time.time()
+        with self._denylist_lock:
+            expired = [key for key, expires_at in self._denylist.items() if expires_at <= now]
+            for key in expired:
+                del self._denylist[key]
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._tokens),
+            "revoked": len(self._denylist),
+        }